@@ -0,0 +1,41 @@
+"""
+Воспроизведение записи обмена через ResponseManager для профилирования
+
+Запись делается через AsyncConnector.start_traffic_recording. Запуск из корня
+репозитория:
+
+    python -m benchmarks.replay traffic.fctraffic --speed 1.0
+"""
+import argparse
+import json
+import sys
+from queue import Queue
+
+from communicator.traffic_recorder import ReplayConnector
+from fc.response_manager import ResponseManager
+from utility.logger import rootLogger
+
+
+def parse_args(argv=None) -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("path", help="file written by TrafficRecorder")
+    parser.add_argument(
+        "--speed",
+        type=float,
+        default=None,
+        help="1.0 keeps the recorded timing, as fast as possible by default",
+    )
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    rootLogger.remove()
+    rootLogger.add(sys.stderr, level="WARNING")
+    response_manager = ResponseManager(Queue())
+    report = ReplayConnector(args.path, response_manager, args.speed).run()
+    print(json.dumps(report, indent=2))
+
+
+if __name__ == "__main__":
+    main()
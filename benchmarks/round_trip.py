@@ -0,0 +1,232 @@
+"""
+Замер пропускной способности и задержки стека связи на встроенном имитаторе
+
+AsyncConnectorTest и Imitator работают в одном процессе через настоящие FIFO
+(или именованные каналы Windows), ответы проходят через ResponseManager.
+Результат печатается в JSON, чтобы сравнивать версии между собой.
+
+Запуск из корня репозитория:
+
+    python -m benchmarks.round_trip --scenario all --output bench_output.json
+"""
+import argparse
+import json
+import platform
+import sys
+import time
+from concurrent.futures import FIRST_COMPLETED, Future, wait
+from queue import Queue
+from typing import Callable, Dict, List
+
+from communicator.bounded_queue import ResponseQueue
+from communicator.imitator.async_test_connector import AsyncConnectorTest
+from communicator.imitator.pipe_read_write import Imitator
+from communicator.locked_queue import LockedPriorityQueue
+from fc.fc_controls import FC_Controls
+from fc.packet_type import ConnectionMethods, OscMethods, RequestTypes
+from fc.response_manager import ResponseManager
+from utility.logger import rootLogger
+from utility.metrics import metrics
+
+try:
+    import resource
+except ImportError:  # Windows
+    resource = None
+
+SCENARIOS = ("control", "scope", "mixed")
+
+
+def percentile(sorted_values: List[float], fraction: float) -> float:
+    if not sorted_values:
+        return 0.0
+    index = min(len(sorted_values) - 1, int(round(fraction * (len(sorted_values) - 1))))
+    return sorted_values[index]
+
+
+def cpu_time() -> float:
+    if resource is None:
+        return time.process_time()
+    usage = resource.getrusage(resource.RUSAGE_SELF)
+    return usage.ru_utime + usage.ru_stime
+
+
+def run_requests(
+    fc_controls: FC_Controls,
+    make_command: Callable[[int], dict],
+    count: int,
+    in_flight: int,
+    timeout: float,
+) -> dict:
+    latencies: List[float] = []
+    errors = 0
+    pending = set()
+
+    def on_done(future: Future, started: float):
+        nonlocal errors
+        if future.cancelled() or future.exception() is not None:
+            errors += 1
+        else:
+            latencies.append(time.perf_counter() - started)
+
+    cpu_started = cpu_time()
+    started = time.perf_counter()
+    for index in range(count):
+        if len(pending) >= in_flight:
+            _, pending = wait(pending, return_when=FIRST_COMPLETED)
+        request_started = time.perf_counter()
+        future = fc_controls.make_request(make_command(index), timeout=timeout)
+        future.add_done_callback(
+            lambda done, request_started=request_started: on_done(done, request_started)
+        )
+        pending.add(future)
+    wait(pending)
+    elapsed = time.perf_counter() - started
+    cpu_elapsed = cpu_time() - cpu_started
+
+    latencies.sort()
+    return {
+        "requests": count,
+        "errors": errors,
+        "elapsed_s": elapsed,
+        "requests_per_second": count / elapsed if elapsed else 0.0,
+        "latency_ms": {
+            "mean": 1e3 * sum(latencies) / len(latencies) if latencies else 0.0,
+            "p50": 1e3 * percentile(latencies, 0.5),
+            "p99": 1e3 * percentile(latencies, 0.99),
+            "p99.9": 1e3 * percentile(latencies, 0.999),
+            "max": 1e3 * latencies[-1] if latencies else 0.0,
+        },
+        # процессорное время всего процесса, включая имитатор
+        "cpu_ms_per_message": 1e3 * cpu_elapsed / count if count else 0.0,
+    }
+
+
+def run_benchmark(args: argparse.Namespace) -> Dict:
+    if args.metrics:
+        metrics.enable()
+    request_queue, response_queue = LockedPriorityQueue(), ResponseQueue()
+    request_queue.coalesce_duplicates = False
+    connector = AsyncConnectorTest(request_queue, response_queue)
+    connector._imitator = Imitator()
+    connector._imitator.verbose = False
+    connector._imitator.waveform_generator.sample_rate = args.sample_rate
+    connector.use_asyncio_engine = args.engine == "asyncio"
+    connector.framing = args.framing
+    response_manager = ResponseManager(response_queue)
+
+    fc_controls = FC_Controls()
+    fc_controls.set_request_queue(request_queue)
+    connector.create_connection()
+
+    setup_arguments = {
+        "Values": [f"signal_{channel}" for channel in range(args.channels)],
+        "PreTrigger": 0.0,
+        "PostTrigger": args.samples / args.sample_rate,
+    }
+    if args.shared_memory:
+        slot_size = 64 + (args.channels + 1) * args.samples * 8
+        setup_arguments["SharedMemory"] = response_manager.enable_scope_shared_memory(
+            slots=8, slot_size=slot_size
+        )
+    fc_controls.make_request(
+        FC_Controls.make_command(
+            RequestTypes.SCOPE, "bench", OscMethods.SETUP, setup_arguments
+        )
+    ).result(args.timeout)
+
+    def ping(index: int) -> dict:
+        return FC_Controls.make_command(
+            RequestTypes.CONNECTION, "bench", ConnectionMethods.PING
+        )
+
+    def scope(index: int) -> dict:
+        return FC_Controls.make_command(RequestTypes.SCOPE, "bench", OscMethods.REQUEST)
+
+    def mixed(index: int) -> dict:
+        return scope(index) if index % (args.mix_ratio + 1) == 0 else ping(index)
+
+    frame_bytes = (args.channels + 1) * args.samples * 8
+    scenarios = SCENARIOS if args.scenario == "all" else (args.scenario,)
+    results = []
+    try:
+        for scenario in scenarios:
+            make_command = {"control": ping, "scope": scope, "mixed": mixed}[scenario]
+            count = args.requests if scenario != "scope" else args.frames
+            # прогрев
+            run_requests(fc_controls, make_command, min(count, 10), 1, args.timeout)
+            result = run_requests(
+                fc_controls, make_command, count, args.in_flight, args.timeout
+            )
+            frames = {
+                "control": 0,
+                "scope": count,
+                "mixed": len(range(0, count, args.mix_ratio + 1)),
+            }[scenario]
+            result["scenario"] = scenario
+            result["scope_bytes_per_second"] = (
+                frames * frame_bytes / result["elapsed_s"] if result["elapsed_s"] else 0.0
+            )
+            results.append(result)
+        metrics_snapshot = metrics.snapshot() if args.metrics else None
+    finally:
+        connector.close_connection()
+        response_manager.join()
+        response_manager.close()
+
+    return {
+        "benchmark": "round_trip",
+        "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "python": platform.python_version(),
+        "platform": sys.platform,
+        "config": {
+            "engine": args.engine,
+            "framing": args.framing,
+            "shared_memory": args.shared_memory,
+            "in_flight": args.in_flight,
+            "samples": args.samples,
+            "channels": args.channels,
+            "sample_rate": args.sample_rate,
+            "mix_ratio": args.mix_ratio,
+        },
+        "results": results,
+        "metrics": metrics_snapshot,
+    }
+
+
+def parse_args(argv=None) -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--scenario", choices=(*SCENARIOS, "all"), default="all")
+    parser.add_argument("--requests", type=int, default=2000)
+    parser.add_argument("--frames", type=int, default=50)
+    parser.add_argument("--samples", type=int, default=10000)
+    parser.add_argument("--channels", type=int, default=4)
+    parser.add_argument("--sample-rate", type=float, default=100_000.0)
+    parser.add_argument("--in-flight", type=int, default=16)
+    parser.add_argument(
+        "--mix-ratio", type=int, default=4, help="control requests per scope request"
+    )
+    parser.add_argument("--engine", choices=("threads", "asyncio"), default="threads")
+    parser.add_argument("--framing", choices=("text", "binary"), default="text")
+    parser.add_argument("--shared-memory", action="store_true")
+    parser.add_argument(
+        "--metrics", action="store_true", help="include utility.metrics snapshot"
+    )
+    parser.add_argument("--timeout", type=float, default=30.0)
+    parser.add_argument("--output", help="file for JSON results, stdout by default")
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    rootLogger.remove()
+    rootLogger.add(sys.stderr, level="WARNING")
+    report = json.dumps(run_benchmark(args), indent=2)
+    if args.output:
+        with open(args.output, "w") as output:
+            output.write(report + "\n")
+    else:
+        print(report)
+
+
+if __name__ == "__main__":
+    main()
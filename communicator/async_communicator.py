@@ -4,13 +4,18 @@ import threading
 from pathlib import Path
 from queue import Queue
 from subprocess import Popen
+from time import perf_counter, sleep
 from typing import Optional, Union, Literal, Any, Tuple, Dict, List
 
 from PyQt5.QtCore import QObject
 
+from communicator.asyncio_engine import AsyncioPipeEngine
 from communicator.locked_queue import LockedPriorityQueue
+from communicator.pending_requests import PendingRequests, QueuedRequest
 from communicator.pipe_communicator import PipeCommunicator
-from utility.logger import rootLogger
+from communicator.traffic_recorder import RECEIVED, SENT, TrafficRecorder
+from utility.logger import lazyLogger, rootLogger, short_repr
+from utility.metrics import metrics, request_key
 
 COMMUNICATOR_PATH = Path("bin", "JsonRpcPipesConnector")
 
@@ -26,12 +31,35 @@ class AsyncConnector(QObject):
     instance = None
     input_pipe_name = "asc_rx"
     output_pipe_name = "asc_tx"
+    # обслуживание пайпов одним event loop вместо потоков _send/_receive (только Linux)
+    use_asyncio_engine = False
+    # "binary" - согласовать с другой стороной формат с заголовком длины (только Linux)
+    framing = "text"
+    framing_negotiation_timeout = 1.0
+    # сколько ждать, пока процесс соединения откроет свои концы пайпов (Linux)
+    pipe_open_timeout = 5.0
+    # после открытия пайпов процесс должен ответить на Connection/ready
+    # {"Ready": true}; включается только для соединений, которые это умеют
+    ready_handshake = False
+    ready_timeout = 5.0
+    # переподключение при обрыве канала: отправленные идемпотентные запросы без
+    # ответа отправляются повторно, остальные сразу завершаются с ConnectionError
+    auto_reconnect = True
+    reconnect_attempts = 10
+    reconnect_backoff_min = 0.01
+    reconnect_backoff_max = 1.0
 
     def __new__(
             cls,
             request_queue: Optional[LockedPriorityQueue],
             response_queue: Optional[Queue],
+            device: Optional[str] = None,
     ):
+        # соединения с отдельными устройствами пула не разделяют общий экземпляр
+        if device is not None:
+            return super(AsyncConnector, cls).__new__(
+                cls, request_queue, response_queue
+            )
         if cls.instance is None:
             cls.instance = super(AsyncConnector, cls).__new__(
                 cls, request_queue, response_queue
@@ -42,19 +70,42 @@ class AsyncConnector(QObject):
             self,
             request_queue: Optional[LockedPriorityQueue],
             response_queue: Optional[Queue],
+            device: Optional[str] = None,
     ):
+        """
+        :param device: ключ устройства в ConnectorPool. Без него соединение -
+            общий для процесса экземпляр с пайпами asc_rx/asc_tx, с ним - отдельный
+            экземпляр с пайпами asc_rx_<device>/asc_tx_<device>
+        """
         super(QObject, AsyncConnector).__init__(self)
         self._receive_thread = None
         self._send_thread = None
         self.answer_queue = response_queue
         self.request_queue = request_queue
-        if not hasattr(self.instance, "is_connected"):
+        if not hasattr(self, "is_connected"):
+            self.device = device
+            if device is not None:
+                self.input_pipe_name = f"{self.input_pipe_name}_{device}"
+                self.output_pipe_name = f"{self.output_pipe_name}_{device}"
             self.pipe_communicator = PipeCommunicator(
                 input_pipe=self.input_pipe_name, output_pipe=self.output_pipe_name
             )
             self.executable_args = [
                 pipe_executable_path,
             ]
+            if device is not None:
+                # процессу устройства пула передаются имена его пайпов
+                self.executable_args += [self.input_pipe_name, self.output_pipe_name]
+            self.pending_requests = PendingRequests()
+            self._engine: Optional[AsyncioPipeEngine] = None
+            self.traffic_recorder: Optional[TrafficRecorder] = None
+            # время последнего подключения от запуска процесса до готовности, с
+            self.connect_time: Optional[float] = None
+            # номер подключения: потоки прежнего подключения по нему понимают,
+            # что пора завершиться, и не закрывают новое
+            self._generation = 0
+            self._connection_lock = threading.Lock()
+            self._reconnect_thread: Optional[threading.Thread] = None
             self.is_connected = False
 
     def set_answer_queue(self, q):
@@ -72,7 +123,11 @@ class AsyncConnector(QObject):
         # to implement
         return connection_type, connection_params
 
-    def create_connection(self):
+    def create_connection(self, replay: Optional[List[QueuedRequest]] = None):
+        """
+        :param replay: запросы, отправляемые первыми после подключения. Если
+            задано, ожидающие в очереди запросы сохраняются (переподключение)
+        """
         if self.is_connected:
             return
         if errors := self._validate_connection_params():
@@ -80,28 +135,195 @@ class AsyncConnector(QObject):
             for error in errors:
                 rootLogger.error(error)
             return
+        started = perf_counter()
+        # процесс запускается и открывает свои концы пайпов параллельно с нами
         self._run_async_connector()
-        self.pipe_communicator.input_pipe_name = self.input_pipe_name
-        self.pipe_communicator.output_pipe_name = self.output_pipe_name
-        self.pipe_communicator.open_connection()
-        while not self.request_queue.empty():
-            self.request_queue.get(block=True)
+        try:
+            self._open_pipes()
+        except (OSError, TimeoutError) as exc:
+            rootLogger.error(f"Connection failed: {exc}")
+            self._stop_async_connector()
+            if self._engine is not None:
+                self._engine.stop()
+                self._engine = None
+            else:
+                self.pipe_communicator.close_connection()
+            return
+        if replay is None:
+            while not self.request_queue.empty():
+                self.request_queue.get(block=True).set_exception(
+                    ConnectionError("Connection was reopened before request was sent")
+                )
+        self._register_metrics_gauges()
         self.is_connected = True
         self.request_queue.unlock()
-        self._send_thread = threading.Thread(target=self._send, daemon=True)
-        self._receive_thread = threading.Thread(target=self._receive, daemon=True)
-        self._send_thread.start()
-        self._receive_thread.start()
-        rootLogger.success("Connection opened")
+        for queued_request in replay or ():
+            self.request_queue.requeue(queued_request)
+        if self._engine is not None:
+            self._engine.start()
+        else:
+            self._send_thread = threading.Thread(
+                target=self._send, args=(self._generation,), daemon=True
+            )
+            self._receive_thread = threading.Thread(
+                target=self._receive, args=(self._generation,), daemon=True
+            )
+            self._send_thread.start()
+            self._receive_thread.start()
+        self.connect_time = perf_counter() - started
+        if metrics.enabled:
+            metrics.observe("connect", self.device, self.connect_time)
+        rootLogger.success(f"Connection opened in {1e3 * self.connect_time:.0f} ms")
+
+    def _open_pipes(self) -> None:
+        if self.use_asyncio_engine and sys.platform != "win32":
+            self._engine = AsyncioPipeEngine(
+                self, self.input_pipe_name, self.output_pipe_name, self._generation
+            )
+            self._engine.open(self.pipe_open_timeout)
+            channel = self._engine
+        else:
+            self.pipe_communicator.input_pipe_name = self.input_pipe_name
+            self.pipe_communicator.output_pipe_name = self.output_pipe_name
+            self.pipe_communicator.open_connection(self.pipe_open_timeout)
+            channel = self.pipe_communicator
+        if self.ready_handshake and not channel.wait_ready(self.ready_timeout):
+            raise TimeoutError(
+                f"Connector did not report ready in {self.ready_timeout} s"
+            )
+        if self.framing != "text":
+            channel.negotiate_framing(
+                [self.framing, "text"], self.framing_negotiation_timeout
+            )
 
     def close_connection(self):
+        # явное закрытие отменяет переподключение
+        self._reconnect_thread = None
+        for queued_request in self._teardown():
+            queued_request.set_exception(ConnectionError("Connection closed"))
+
+    def _teardown(self) -> List[QueuedRequest]:
+        """
+        :return: отправленные запросы, оставшиеся без ответа
+        """
+        with self._connection_lock:
+            if not self._disconnect():
+                return []
+        return self._release_connection()
+
+    def _disconnect(self) -> bool:
+        """
+        Вызывается под _connection_lock
+
+        :return: False, если соединение уже закрыто другим потоком
+        """
         if not self.is_connected:
-            return
+            return False
         self.is_connected = False
+        self._generation += 1
+        return True
+
+    def _release_connection(self) -> List[QueuedRequest]:
         self.request_queue.lock()
+        unanswered = self.pending_requests.clear()
         self._stop_async_connector()
-        self.pipe_communicator.close_connection()
+        if self._engine is not None:
+            self._engine.stop()
+            self._engine = None
+        else:
+            self.pipe_communicator.close_connection()
         rootLogger.info("Connection closed")
+        return unanswered
+
+    def _connection_lost(self, generation: int) -> None:
+        replay: List[QueuedRequest] = []
+        # обрыв замечают оба потока поколения: закрывает соединение и
+        # запускает переподключение только первый
+        with self._connection_lock:
+            if generation != self._generation or not self._disconnect():
+                return
+            reconnect_thread = None
+            if self.auto_reconnect and self._reconnect_thread is None:
+                reconnect_thread = threading.Thread(
+                    target=self._reconnect, args=(replay,), daemon=True
+                )
+                self._reconnect_thread = reconnect_thread
+        for queued_request in self._release_connection():
+            if reconnect_thread is not None and queued_request.idempotent:
+                replay.append(queued_request)
+            else:
+                queued_request.set_exception(
+                    ConnectionError("Connection lost before the answer was received")
+                )
+        if reconnect_thread is not None:
+            rootLogger.warning(
+                f"Connection lost, reconnecting with {len(replay)} requests to replay"
+            )
+            reconnect_thread.start()
+
+    def _reconnect(self, replay: List[QueuedRequest]) -> None:
+        started = perf_counter()
+        delay = self.reconnect_backoff_min
+        for attempt in range(1, self.reconnect_attempts + 1):
+            if self._reconnect_thread is not threading.current_thread():
+                # соединение закрыто явно
+                for queued_request in replay:
+                    queued_request.set_exception(ConnectionError("Connection closed"))
+                return
+            self.create_connection(replay=replay)
+            if self.is_connected:
+                rootLogger.success(
+                    f"Reconnected after {attempt} attempts "
+                    f"in {1e3 * (perf_counter() - started):.0f} ms"
+                )
+                if metrics.enabled:
+                    metrics.increment("reconnects", self.device)
+                self._reconnect_thread = None
+                return
+            sleep(delay)
+            delay = min(2 * delay, self.reconnect_backoff_max)
+        rootLogger.error("Reconnection failed")
+        if self._reconnect_thread is threading.current_thread():
+            self._reconnect_thread = None
+        error = ConnectionError("Connection lost and could not be restored")
+        for queued_request in replay:
+            queued_request.set_exception(error)
+        while not self.request_queue.empty():
+            self.request_queue.get(block=True).set_exception(error)
+
+    def start_traffic_recording(self, path: Union[str, Path]) -> TrafficRecorder:
+        """
+        Запись всех запросов и ответов в файл до stop_traffic_recording
+        """
+        self.stop_traffic_recording()
+        self.traffic_recorder = TrafficRecorder(path)
+        return self.traffic_recorder
+
+    def stop_traffic_recording(self) -> None:
+        if (traffic_recorder := self.traffic_recorder) is not None:
+            self.traffic_recorder = None
+            traffic_recorder.close()
+
+    def _register_metrics_gauges(self) -> None:
+        suffix = "" if self.device is None else f"[{self.device}]"
+        metrics.register_gauge(
+            f"request_queue_depth{suffix}", lambda: self.request_queue.qsize()
+        )
+        metrics.register_gauge(
+            "response_queue_depth",
+            lambda: self.answer_queue.qsize() if self.answer_queue is not None else 0,
+        )
+        metrics.register_gauge(
+            f"pending_requests{suffix}", lambda: len(self.pending_requests)
+        )
+        # пределы очередей: размер, наибольший размер, выброшенные и отклонённые
+        metrics.register_gauge(
+            f"request_queue_bounds{suffix}", lambda: self.request_queue.stats()
+        )
+        if hasattr(self.answer_queue, "stats"):
+            metrics.register_gauge(
+                "response_queue_bounds", lambda: self.answer_queue.stats()
+            )
 
     def _validate_connection_params(self) -> List[str]:
         errors = []
@@ -132,25 +354,98 @@ class AsyncConnector(QObject):
             self.close_connection()
             self.create_connection()
 
-    def _send(self):
-        while self.is_connected and self.pipe_communicator.is_connected:
-            if prepared_request := self.request_queue.get():
-                rootLogger.debug(f"{prepared_request = }")
-                self.pipe_communicator.send(prepared_request)
+    def _is_current(self, generation: int) -> bool:
+        return (
+            generation == self._generation
+            and self.is_connected
+            and self.pipe_communicator.is_connected
+        )
+
+    def _send(self, generation: int):
+        while self._is_current(generation):
+            if queued_request := self.request_queue.get():
+                if generation != self._generation:
+                    # поток прежнего подключения: запрос достаётся новому
+                    self.request_queue.requeue(queued_request)
+                elif self._prepare_to_send(queued_request):
+                    self.pipe_communicator.send_request(queued_request)
                 self.request_queue.task_done()
-        self.close_connection()
+        self._connection_lost(generation)
 
-    def _receive(self):
-        while self.is_connected and self.pipe_communicator.is_connected:
+    def _receive(self, generation: int):
+        while self._is_current(generation):
             answer_list = self.pipe_communicator.receive()
             if not answer_list:
                 continue
-            rootLogger.debug(f"{answer_list = }")
-            for answer in answer_list:
-                prepared_answer = json.loads(answer)
-                rootLogger.debug(f"{prepared_answer = }")
-                request_to_manage, answer_value = prepared_answer.popitem()
-                request_to_manage = json.loads(request_to_manage)
-                if self.answer_queue is not None:
-                    self.answer_queue.put((request_to_manage, answer_value))
-        self.close_connection()
+            lazyLogger.debug("answer_list = {}", lambda: short_repr(answer_list))
+            for prepared_answer in answer_list:
+                self._handle_answer(prepared_answer)
+        self._connection_lost(generation)
+
+    def _prepare_to_send(self, queued_request: QueuedRequest) -> bool:
+        lazyLogger.debug("queued_request = {}", lambda: short_repr(queued_request))
+        if queued_request.is_cancelled():
+            return False
+        if queued_request.is_expired():
+            lazyLogger.debug(
+                "Dropping stale queued_request = {}", lambda: short_repr(queued_request)
+            )
+            if metrics.enabled:
+                metrics.increment("expired", request_key(queued_request.request))
+            queued_request.set_exception(TimeoutError("Request expired before sending"))
+            return False
+        if metrics.enabled:
+            queued_request.sent = perf_counter()
+            metrics.observe(
+                "queue_wait",
+                request_key(queued_request.request),
+                queued_request.sent - queued_request.created,
+            )
+        if queued_request.request_id is not None:
+            self.pending_requests.add(queued_request)
+        if (traffic_recorder := self.traffic_recorder) is not None:
+            traffic_recorder.record(SENT, queued_request.request)
+        return True
+
+    def _handle_answer(self, prepared_answer: dict) -> None:
+        lazyLogger.debug("prepared_answer = {}", lambda: short_repr(prepared_answer))
+        if (traffic_recorder := self.traffic_recorder) is not None:
+            traffic_recorder.record(RECEIVED, prepared_answer)
+        request_to_manage, answer_value = self._resolve_answer(prepared_answer)
+        if request_to_manage is not None and self.answer_queue is not None:
+            self.answer_queue.put((request_to_manage, answer_value))
+
+    def _resolve_answer(self, prepared_answer: dict) -> Tuple[Optional[dict], Any]:
+        if "Id" in prepared_answer:
+            request_id = prepared_answer["Id"]
+            # промежуточная часть потокового ответа: запрос остаётся в ожидании
+            # до последней части, Future завершается её значением
+            more = prepared_answer.get("More", False)
+            if more:
+                queued_request = self.pending_requests.get(request_id)
+            else:
+                queued_request = self.pending_requests.pop(request_id)
+            if queued_request is None:
+                rootLogger.warning(f"Got answer for unknown request {request_id = }")
+                return None, None
+            answer_value = prepared_answer.get("Value")
+            if not more:
+                if metrics.enabled:
+                    self._observe_answer(queued_request)
+                queued_request.set_result(answer_value)
+            return queued_request.request, answer_value
+        # старый формат ответа: {json.dumps(request): value}
+        request_to_manage, answer_value = prepared_answer.popitem()
+        request_to_manage = json.loads(request_to_manage)
+        if queued_request := self.pending_requests.pop(request_to_manage.get("Id")):
+            queued_request.set_result(answer_value)
+            request_to_manage = queued_request.request
+        return request_to_manage, answer_value
+
+    @staticmethod
+    def _observe_answer(queued_request: QueuedRequest) -> None:
+        now = perf_counter()
+        key = request_key(queued_request.request)
+        if queued_request.sent is not None:
+            metrics.observe("round_trip", key, now - queued_request.sent)
+        metrics.observe("end_to_end", key, now - queued_request.created)
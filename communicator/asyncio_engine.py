@@ -0,0 +1,205 @@
+import asyncio
+import os
+import threading
+from queue import Empty
+from typing import Optional, Sequence
+
+from communicator.framing import FRAMINGS, TextFraming, negotiate_framing, wait_ready
+from communicator.pipe_communicator import open_fifo_pair
+from utility.logger import rootLogger
+from utility.metrics import metrics
+
+
+class AsyncioPipeEngine:
+    """
+    Обслуживание обоих FIFO соединения из одного event loop (только Linux)
+
+    Пайпы переводятся в неблокирующий режим, чтение и запись идут через
+    add_reader/add_writer. Очередь запросов будит loop через call_soon_threadsafe,
+    поэтому отдельные потоки отправки и приёма не нужны
+    """
+
+    read_size = 64 * 1024
+    write_high_water = 4 * 1024 * 1024
+
+    def __init__(
+        self,
+        connector,
+        input_pipe_name: str,
+        output_pipe_name: str,
+        generation: int = 0,
+    ):
+        self.connector = connector
+        self.generation = generation
+        self.input_pipe_name = input_pipe_name
+        self.output_pipe_name = output_pipe_name
+        self.input_fd: Optional[int] = None
+        self.output_fd: Optional[int] = None
+        self.loop: Optional[asyncio.AbstractEventLoop] = None
+        self._thread: Optional[threading.Thread] = None
+        self._stop_event: Optional[asyncio.Event] = None
+        self._request_event: Optional[asyncio.Event] = None
+        self._drained: Optional[asyncio.Event] = None
+        self.input_framing = TextFraming()
+        self.output_framing = TextFraming()
+        self._out_buffer = bytearray()
+
+    def open(self, timeout: float) -> None:
+        self.input_fd, self.output_fd = open_fifo_pair(
+            self.input_pipe_name, self.output_pipe_name, timeout
+        )
+        rootLogger.success(
+            f"Pipes {self.output_pipe_name}, {self.input_pipe_name} were opened"
+        )
+
+    def wait_ready(self, timeout: float) -> bool:
+        return wait_ready(self.output_fd, self.input_fd, timeout)
+
+    def negotiate_framing(self, modes: Sequence[str], timeout: float) -> str:
+        mode = negotiate_framing(self.output_fd, self.input_fd, modes, timeout)
+        self.input_framing = FRAMINGS[mode]()
+        self.output_framing = FRAMINGS[mode]()
+        return mode
+
+    def start(self) -> None:
+        os.set_blocking(self.output_fd, False)
+        os.set_blocking(self.input_fd, False)
+        started = threading.Event()
+        self._thread = threading.Thread(target=self._run, args=(started,), daemon=True)
+        self._thread.start()
+        started.wait()
+
+    def stop(self) -> None:
+        if self.loop is None:
+            # loop не запускался (соединение не установилось)
+            self._close_pipes()
+            return
+        if self.loop.is_closed():
+            return
+        try:
+            self.loop.call_soon_threadsafe(self._stop_event.set)
+        except RuntimeError:  # loop уже закрыт
+            return
+        if self._thread is not threading.current_thread():
+            self._thread.join()
+
+    def _run(self, started: threading.Event) -> None:
+        try:
+            asyncio.run(self._main(started))
+        finally:
+            self._close_pipes()
+
+    async def _main(self, started: threading.Event) -> None:
+        self.loop = asyncio.get_running_loop()
+        self._stop_event = asyncio.Event()
+        self._request_event = asyncio.Event()
+        self._drained = asyncio.Event()
+        self._drained.set()
+
+        def wake_up():
+            self.loop.call_soon_threadsafe(self._request_event.set)
+
+        request_queue = self.connector.request_queue
+        request_queue.add_put_listener(wake_up)
+        self.loop.add_reader(self.input_fd, self._on_readable)
+        self._request_event.set()  # запросы, добавленные до запуска loop
+        started.set()
+        send_task = asyncio.create_task(self._send_loop())
+        try:
+            await self._stop_event.wait()
+        finally:
+            request_queue.remove_put_listener(wake_up)
+            send_task.cancel()
+            self.loop.remove_reader(self.input_fd)
+            self.loop.remove_writer(self.output_fd)
+
+    async def _send_loop(self) -> None:
+        request_queue = self.connector.request_queue
+        while True:
+            await self._request_event.wait()
+            self._request_event.clear()
+            while True:
+                try:
+                    queued_request = request_queue.get_nowait()
+                except Empty:
+                    break
+                if self.connector._prepare_to_send(queued_request):
+                    self._write(self.output_framing.encode_request(queued_request))
+                request_queue.task_done()
+                if not self._drained.is_set():
+                    await self._drained.wait()
+
+    def _write(self, data: bytes) -> None:
+        if metrics.enabled:
+            metrics.increment("bytes_out", self.output_pipe_name, len(data))
+        if not self._out_buffer:
+            try:
+                written = os.write(self.output_fd, data)
+            except BlockingIOError:
+                written = 0
+            except OSError as exc:
+                self._on_broken(self.output_pipe_name, exc)
+                return
+            if written == len(data):
+                return
+            data = data[written:]
+            self.loop.add_writer(self.output_fd, self._on_writable)
+        self._out_buffer += data
+        if len(self._out_buffer) > self.write_high_water:
+            self._drained.clear()
+
+    def _on_writable(self) -> None:
+        try:
+            written = os.write(self.output_fd, self._out_buffer)
+        except BlockingIOError:
+            return
+        except OSError as exc:
+            self._on_broken(self.output_pipe_name, exc)
+            return
+        del self._out_buffer[:written]
+        if not self._out_buffer:
+            self.loop.remove_writer(self.output_fd)
+        if len(self._out_buffer) <= self.write_high_water:
+            self._drained.set()
+
+    def _on_readable(self) -> None:
+        try:
+            data = os.read(self.input_fd, self.read_size)
+        except BlockingIOError:
+            return
+        except OSError as exc:
+            self._on_broken(self.input_pipe_name, exc)
+            return
+        if not data:
+            self._on_broken(self.input_pipe_name, EOFError("Peer closed the pipe"))
+            return
+        if metrics.enabled:
+            metrics.increment("bytes_in", self.input_pipe_name, len(data))
+        for prepared_answer in self.input_framing.feed(data):
+            self.connector._handle_answer(prepared_answer)
+
+    def _on_broken(self, pipe_name: str, exc: Exception) -> None:
+        rootLogger.critical(f"Pipe {pipe_name} was accidentally broken with error: {exc}")
+        self.loop.remove_reader(self.input_fd)
+        self.loop.remove_writer(self.output_fd)
+        self._stop_event.set()
+        # обработка обрыва ждёт остановки loop, поэтому выполняется вне его потока
+        threading.Thread(
+            target=self.connector._connection_lost,
+            args=(self.generation,),
+            daemon=True,
+        ).start()
+
+    def _close_pipes(self) -> None:
+        for fd in (self.input_fd, self.output_fd):
+            if fd is not None:
+                os.close(fd)
+        self.input_fd = self.output_fd = None
+        for name in (self.input_pipe_name, self.output_pipe_name):
+            try:
+                os.remove(name)
+            except FileNotFoundError:
+                pass
+        rootLogger.critical(
+            f"Pipes {self.input_pipe_name}, {self.output_pipe_name} were disconnected"
+        )
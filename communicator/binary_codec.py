@@ -0,0 +1,254 @@
+"""
+Компактное бинарное представление сообщений (подмножество MessagePack)
+
+Числа в заголовках хранятся в big-endian, как требует MessagePack. Массивы
+вещественных чисел упаковываются в ext-тип FLOAT64_ARRAY_EXT как сырой буфер
+little-endian float64 и распаковываются в array("d") без разбора по элементам
+"""
+import struct
+import sys
+from array import array
+from typing import Any, List, Tuple
+
+FLOAT64_ARRAY_EXT = 1
+# короче этого списки float упаковываются поэлементно
+FLOAT_ARRAY_MIN_LENGTH = 8
+
+_LITTLE_ENDIAN = sys.byteorder == "little"
+
+_uint8 = struct.Struct(">B")
+_uint16 = struct.Struct(">H")
+_uint32 = struct.Struct(">I")
+_uint64 = struct.Struct(">Q")
+_int8 = struct.Struct(">b")
+_int16 = struct.Struct(">h")
+_int32 = struct.Struct(">i")
+_int64 = struct.Struct(">q")
+_float32 = struct.Struct(">f")
+_float64 = struct.Struct(">d")
+
+
+def pack(value: Any) -> bytes:
+    chunks: List[bytes] = []
+    _pack(value, chunks)
+    return b"".join(chunks)
+
+
+def unpack(data: bytes) -> Any:
+    """
+    :raise ValueError: данные обрезаны или повреждены
+    """
+    value, _ = _unpack(data, 0)
+    return value
+
+
+def _pack(value: Any, out: List[bytes]) -> None:
+    if value is None:
+        out.append(b"\xc0")
+    elif value is True:
+        out.append(b"\xc3")
+    elif value is False:
+        out.append(b"\xc2")
+    elif isinstance(value, int):
+        _pack_int(value, out)
+    elif isinstance(value, float):
+        out.append(b"\xcb" + _float64.pack(value))
+    elif isinstance(value, str):
+        data = value.encode("UTF-8")
+        size = len(data)
+        if size < 32:
+            out.append(_uint8.pack(0xA0 | size))
+        elif size < 0x100:
+            out.append(b"\xd9" + _uint8.pack(size))
+        elif size < 0x10000:
+            out.append(b"\xda" + _uint16.pack(size))
+        else:
+            out.append(b"\xdb" + _uint32.pack(size))
+        out.append(data)
+    elif isinstance(value, dict):
+        size = len(value)
+        if size < 16:
+            out.append(_uint8.pack(0x80 | size))
+        elif size < 0x10000:
+            out.append(b"\xde" + _uint16.pack(size))
+        else:
+            out.append(b"\xdf" + _uint32.pack(size))
+        for key, item in value.items():
+            _pack(key, out)
+            _pack(item, out)
+    elif isinstance(value, (list, tuple)):
+        if len(value) >= FLOAT_ARRAY_MIN_LENGTH and all(
+            type(item) is float for item in value
+        ):
+            _pack_float_array(array("d", value), out)
+            return
+        size = len(value)
+        if size < 16:
+            out.append(_uint8.pack(0x90 | size))
+        elif size < 0x10000:
+            out.append(b"\xdc" + _uint16.pack(size))
+        else:
+            out.append(b"\xdd" + _uint32.pack(size))
+        for item in value:
+            _pack(item, out)
+    elif isinstance(value, array) and value.typecode == "d":
+        _pack_float_array(value, out)
+    elif getattr(value, "ndim", 0) > 0:  # numpy.ndarray
+        data = value.astype("<f8", copy=False).tobytes()
+        out.append(b"\xc9" + _uint32.pack(len(data)) + _int8.pack(FLOAT64_ARRAY_EXT))
+        out.append(data)
+    elif isinstance(value, (bytes, bytearray, memoryview)):
+        data = bytes(value)
+        size = len(data)
+        if size < 0x100:
+            out.append(b"\xc4" + _uint8.pack(size))
+        elif size < 0x10000:
+            out.append(b"\xc5" + _uint16.pack(size))
+        else:
+            out.append(b"\xc6" + _uint32.pack(size))
+        out.append(data)
+    else:
+        raise TypeError(f"Cannot pack value of type {type(value).__name__}")
+
+
+def _pack_int(value: int, out: List[bytes]) -> None:
+    if 0 <= value < 0x80:
+        out.append(_uint8.pack(value))
+    elif -32 <= value < 0:
+        out.append(_int8.pack(value))
+    elif -(2**63) <= value < 2**63:
+        out.append(b"\xd3" + _int64.pack(value))
+    elif 0 <= value < 2**64:
+        out.append(b"\xcf" + _uint64.pack(value))
+    else:
+        raise OverflowError(f"Integer {value} is too big to pack")
+
+
+def _pack_float_array(values: array, out: List[bytes]) -> None:
+    if not _LITTLE_ENDIAN:
+        values = array("d", values)
+        values.byteswap()
+    data = values.tobytes()
+    out.append(b"\xc9" + _uint32.pack(len(data)) + _int8.pack(FLOAT64_ARRAY_EXT))
+    out.append(data)
+
+
+def _unpack_float_array(data: bytes) -> array:
+    values = array("d")
+    values.frombytes(data)
+    if not _LITTLE_ENDIAN:
+        values.byteswap()
+    return values
+
+
+def _check_size(data: bytes, end: int) -> None:
+    # срез за концом данных молча вернул бы обрезанное значение
+    if end > len(data):
+        raise ValueError(f"Truncated message: need {end} bytes, got {len(data)}")
+
+
+def _unpack(data: bytes, offset: int) -> Tuple[Any, int]:
+    _check_size(data, offset + 1)
+    code = data[offset]
+    offset += 1
+    if code < 0x80:
+        return code, offset
+    if code >= 0xE0:
+        return code - 0x100, offset
+    if 0xA0 <= code <= 0xBF:
+        return _unpack_str(data, offset, code & 0x1F)
+    if 0x90 <= code <= 0x9F:
+        return _unpack_list(data, offset, code & 0x0F)
+    if 0x80 <= code <= 0x8F:
+        return _unpack_dict(data, offset, code & 0x0F)
+    if code == 0xC0:
+        return None, offset
+    if code == 0xC2:
+        return False, offset
+    if code == 0xC3:
+        return True, offset
+    if code in _fixed_size_numbers:
+        number_struct = _fixed_size_numbers[code]
+        _check_size(data, offset + number_struct.size)
+        return number_struct.unpack_from(data, offset)[0], offset + number_struct.size
+    if code in _sized_types:
+        size_struct, kind = _sized_types[code]
+        _check_size(data, offset + size_struct.size)
+        size = size_struct.unpack_from(data, offset)[0]
+        offset += size_struct.size
+        _check_size(data, offset + size + (kind == "ext"))
+        if kind == "str":
+            return _unpack_str(data, offset, size)
+        if kind == "bin":
+            return bytes(data[offset : offset + size]), offset + size
+        if kind == "list":
+            return _unpack_list(data, offset, size)
+        if kind == "dict":
+            return _unpack_dict(data, offset, size)
+        ext_type = _int8.unpack_from(data, offset)[0]
+        offset += 1
+        return _unpack_ext(ext_type, data[offset : offset + size]), offset + size
+    if code in _fixed_ext_sizes:
+        size = _fixed_ext_sizes[code]
+        _check_size(data, offset + 1 + size)
+        ext_type = _int8.unpack_from(data, offset)[0]
+        offset += 1
+        return _unpack_ext(ext_type, data[offset : offset + size]), offset + size
+    raise ValueError(f"Unknown type code 0x{code:02x}")
+
+
+def _unpack_str(data: bytes, offset: int, size: int) -> Tuple[str, int]:
+    return bytes(data[offset : offset + size]).decode("UTF-8"), offset + size
+
+
+def _unpack_list(data: bytes, offset: int, size: int) -> Tuple[list, int]:
+    values = []
+    for _ in range(size):
+        value, offset = _unpack(data, offset)
+        values.append(value)
+    return values, offset
+
+
+def _unpack_dict(data: bytes, offset: int, size: int) -> Tuple[dict, int]:
+    values = dict()
+    for _ in range(size):
+        key, offset = _unpack(data, offset)
+        value, offset = _unpack(data, offset)
+        values[key] = value
+    return values, offset
+
+
+def _unpack_ext(ext_type: int, data: bytes) -> Any:
+    if ext_type == FLOAT64_ARRAY_EXT:
+        return _unpack_float_array(data)
+    return ext_type, bytes(data)
+
+
+_fixed_size_numbers = {
+    0xCA: _float32,
+    0xCB: _float64,
+    0xCC: _uint8,
+    0xCD: _uint16,
+    0xCE: _uint32,
+    0xCF: _uint64,
+    0xD0: _int8,
+    0xD1: _int16,
+    0xD2: _int32,
+    0xD3: _int64,
+}
+_sized_types = {
+    0xC4: (_uint8, "bin"),
+    0xC5: (_uint16, "bin"),
+    0xC6: (_uint32, "bin"),
+    0xC7: (_uint8, "ext"),
+    0xC8: (_uint16, "ext"),
+    0xC9: (_uint32, "ext"),
+    0xD9: (_uint8, "str"),
+    0xDA: (_uint16, "str"),
+    0xDB: (_uint32, "str"),
+    0xDC: (_uint16, "list"),
+    0xDD: (_uint32, "list"),
+    0xDE: (_uint16, "dict"),
+    0xDF: (_uint32, "dict"),
+}
+_fixed_ext_sizes = {0xD4: 1, 0xD5: 2, 0xD6: 4, 0xD7: 8, 0xD8: 16}
@@ -0,0 +1,204 @@
+from collections import defaultdict
+from enum import Enum
+from queue import Full, Queue
+from typing import Dict, Hashable, Optional, Tuple
+
+from fc.packet_type import OscMethods, RequestTypes
+
+
+class QueuePolicy(str, Enum):
+    """
+    Что делать с новым элементом, когда его класс занял свой предел
+    """
+
+    BLOCK = "block"  # ждать места (не дольше block_timeout), затем queue.Full
+    FAIL = "fail"  # сразу queue.Full
+    DROP_OLDEST = "drop_oldest"  # выбросить самый старый элемент того же класса
+    # то же, что DROP_OLDEST, и вдобавок ждущий элемент с тем же latest_key
+    # заменяется новым при любом размере очереди
+    KEEP_LATEST = "keep_latest"
+
+
+def _class_name(message_class: Hashable) -> str:
+    return str(getattr(message_class, "name", message_class))
+
+
+class BoundedClassesMixin:
+    """
+    Ограничение очереди по классам сообщений: у каждого класса свой предел
+    числа ждущих элементов и своя политика при его достижении
+
+    Подмешивается перед Queue/PriorityQueue. Наследник определяет класс
+    элемента (message_class), ключ замены (latest_key), удаление элементов
+    из self.queue и вызывает _count из своих _put и _get
+    """
+
+    # класс сообщения -> (предел, политика); классы без записи не ограничены
+    class_limits: Dict[Hashable, Tuple[int, QueuePolicy]] = dict()
+    # сколько ждать места при политике BLOCK, None - без ограничения
+    block_timeout: Optional[float] = None
+
+    def _init_bounds(self) -> None:
+        self.class_limits = dict(self.class_limits)
+        self.class_sizes: Dict[Hashable, int] = defaultdict(int)
+        self.high_water: Dict[Hashable, int] = defaultdict(int)
+        self.dropped: Dict[Hashable, int] = defaultdict(int)
+        self.rejected: Dict[Hashable, int] = defaultdict(int)
+
+    def set_class_limit(
+        self, message_class: Hashable, limit: int, policy: QueuePolicy
+    ) -> None:
+        with self.mutex:
+            self.class_limits[message_class] = (limit, QueuePolicy(policy))
+            self.not_full.notify_all()
+
+    def message_class(self, item) -> Hashable:
+        raise NotImplementedError
+
+    def latest_key(self, item) -> Hashable:
+        return self.message_class(item)
+
+    def put(self, item, block: bool = True, timeout: Optional[float] = None):
+        message_class = self.message_class(item)
+        limit, policy = self.class_limits.get(message_class, (0, QueuePolicy.BLOCK))
+        dropped = []
+        with self.not_full:
+            if policy == QueuePolicy.KEEP_LATEST:
+                previous = self._remove_latest(message_class, self.latest_key(item))
+                if previous is not None:
+                    dropped.append(previous)
+            if (
+                limit > 0
+                and self.class_sizes[message_class] >= limit
+                and not self._absorbs(item)
+            ):
+                if policy in (QueuePolicy.DROP_OLDEST, QueuePolicy.KEEP_LATEST):
+                    dropped.append(self._remove_oldest(message_class))
+                elif policy == QueuePolicy.FAIL or not block:
+                    self.rejected[message_class] += 1
+                    raise Full(f"Queue limit for {_class_name(message_class)} reached")
+                elif not self.not_full.wait_for(
+                    lambda: self.class_sizes[message_class] < limit,
+                    self.block_timeout if timeout is None else timeout,
+                ):
+                    self.rejected[message_class] += 1
+                    raise Full(f"Queue limit for {_class_name(message_class)} reached")
+            self._put(item)
+            self.unfinished_tasks += 1
+            self.not_empty.notify()
+            self.dropped[message_class] += len(dropped)
+        for dropped_item in dropped:
+            self._on_dropped(dropped_item)
+
+    def _count(self, item, delta: int) -> None:
+        message_class = self.message_class(item)
+        size = self.class_sizes[message_class] + delta
+        self.class_sizes[message_class] = size
+        if size > self.high_water[message_class]:
+            self.high_water[message_class] = size
+        elif delta < 0:
+            # get будит одного ждущего, а место освободилось в конкретном классе
+            self.not_full.notify_all()
+
+    def _discard(self, item) -> None:
+        # вызывается под self.mutex; task_done для выброшенного элемента не будет
+        self._count(item, -1)
+        self.unfinished_tasks -= 1
+        if not self.unfinished_tasks:
+            self.all_tasks_done.notify_all()
+
+    def _absorbs(self, item) -> bool:
+        """
+        :return: элемент будет объединён с уже ждущим и места не займёт
+        """
+        return False
+
+    def _remove_oldest(self, message_class: Hashable):
+        raise NotImplementedError
+
+    def _remove_latest(self, message_class: Hashable, key: Hashable):
+        raise NotImplementedError
+
+    def _on_dropped(self, item) -> None:
+        pass
+
+    def stats(self) -> dict:
+        """
+        :return: текущий размер, наибольший размер, число выброшенных и
+            отклонённых элементов по классам
+        """
+        with self.mutex:
+            return {
+                name: {_class_name(key): value for key, value in values.items()}
+                for name, values in (
+                    ("size", self.class_sizes),
+                    ("high_water", self.high_water),
+                    ("dropped", self.dropped),
+                    ("rejected", self.rejected),
+                )
+            }
+
+
+class ResponseClass(str, Enum):
+    CONTROL = "control"
+    SCOPE_FRAME = "scope_frame"
+    SCOPE_CHUNK = "scope_chunk"
+
+
+class ResponseQueue(BoundedClassesMixin, Queue):
+    """
+    Очередь ответов (запрос, значение) от AsyncConnector к ResponseManager
+
+    Если ResponseManager отстаёт, кадры осциллограммы выбрасываются начиная со
+    старых, а остальные ответы притормаживают приём: поток чтения пайпа (или
+    loop AsyncioPipeEngine) ждёт места в очереди. Части потоковой выгрузки не
+    выбрасываются - без любой из них осциллограмма не соберётся
+    """
+
+    class_limits = {
+        ResponseClass.CONTROL: (1024, QueuePolicy.BLOCK),
+        ResponseClass.SCOPE_FRAME: (16, QueuePolicy.DROP_OLDEST),
+        ResponseClass.SCOPE_CHUNK: (256, QueuePolicy.BLOCK),
+    }
+
+    def __init__(self):
+        super().__init__()
+        self._init_bounds()
+
+    def message_class(self, item) -> ResponseClass:
+        request, value = item
+        if request.get("Type") == RequestTypes.SCOPE and request.get("Method") in (
+            OscMethods.REQUEST,
+            OscMethods.DOWNLOAD,
+        ):
+            if isinstance(value, dict) and "Chunk" in value:
+                return ResponseClass.SCOPE_CHUNK
+            return ResponseClass.SCOPE_FRAME
+        return ResponseClass.CONTROL
+
+    def latest_key(self, item) -> tuple:
+        request, _ = item
+        return request.get("Device"), request.get("Name"), request.get("Method")
+
+    def _put(self, item):
+        self._count(item, 1)
+        super()._put(item)
+
+    def _get(self):
+        item = super()._get()
+        self._count(item, -1)
+        return item
+
+    def _remove_oldest(self, message_class: ResponseClass):
+        for index, item in enumerate(self.queue):
+            if self.message_class(item) == message_class:
+                del self.queue[index]
+                self._discard(item)
+                return item
+
+    def _remove_latest(self, message_class: ResponseClass, key: tuple):
+        for index, item in enumerate(self.queue):
+            if self.message_class(item) == message_class and self.latest_key(item) == key:
+                del self.queue[index]
+                self._discard(item)
+                return item
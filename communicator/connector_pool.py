@@ -0,0 +1,121 @@
+from queue import Queue
+from typing import Dict, Iterator, Optional, Sequence, Type
+
+from communicator.async_communicator import AsyncConnector
+from communicator.locked_queue import LockedPriorityQueue
+from utility.logger import rootLogger
+
+
+class DeviceRoutingQueue:
+    """
+    Общая очередь запросов пула: запрос кладётся в очередь устройства
+    из ключа "Device" команды, без ключа - в очередь default_device.
+    Для неизвестного устройства route и is_locked бросают ValueError
+
+    Для FC_Controls выглядит как LockedPriorityQueue
+    """
+
+    def __init__(self, default_device: Optional[str] = None):
+        self.default_device = default_device
+        self.queues: Dict[str, LockedPriorityQueue] = dict()
+
+    def add_device(self, device: str, request_queue: LockedPriorityQueue) -> None:
+        self.queues[device] = request_queue
+        if self.default_device is None:
+            self.default_device = device
+
+    def route(self, request: dict) -> LockedPriorityQueue:
+        device = request.get("Device", self.default_device)
+        if (request_queue := self.queues.get(device)) is None:
+            raise ValueError(f"Unknown device {device!r}")
+        return request_queue
+
+    @property
+    def locked(self) -> bool:
+        return all(request_queue.locked for request_queue in self.queues.values())
+
+    def is_locked(self, request: Optional[dict] = None) -> bool:
+        if request is None:
+            return self.locked
+        return self.route(request).locked
+
+    def lock(self) -> None:
+        for request_queue in self.queues.values():
+            request_queue.lock()
+
+    def unlock(self) -> None:
+        for request_queue in self.queues.values():
+            request_queue.unlock()
+
+    def put(self, queued_request, block: bool = True, timeout=None) -> None:
+        self.route(queued_request.request).put(queued_request, block, timeout)
+
+    def qsize(self) -> int:
+        return sum(request_queue.qsize() for request_queue in self.queues.values())
+
+    def stats(self) -> dict:
+        return {
+            device: request_queue.stats()
+            for device, request_queue in self.queues.items()
+        }
+
+
+class ConnectorPool:
+    """
+    Соединения с несколькими преобразователями из одного процесса
+
+    У каждого устройства свой AsyncConnector со своей парой пайпов, своим
+    процессом JsonRpcPipesConnector и своей очередью запросов. Запросы
+    разводятся по устройствам через request_queue (ключ "Device" в команде
+    FC_Controls.make_command), ответы всех устройств приходят в общую
+    response_queue и обрабатываются одним ResponseManager
+    """
+
+    def __init__(
+        self,
+        devices: Sequence[str],
+        response_queue: Queue,
+        connector_class: Type[AsyncConnector] = AsyncConnector,
+    ):
+        if not devices:
+            raise ValueError("Connector pool needs at least one device")
+        self.response_queue = response_queue
+        self.request_queue = DeviceRoutingQueue(devices[0])
+        self.connectors: Dict[str, AsyncConnector] = dict()
+        for device in devices:
+            request_queue = LockedPriorityQueue()
+            self.request_queue.add_device(device, request_queue)
+            self.connectors[device] = connector_class(
+                request_queue, response_queue, device=device
+            )
+
+    @property
+    def devices(self) -> Sequence[str]:
+        return list(self.connectors)
+
+    @property
+    def is_connected(self) -> bool:
+        return all(connector.is_connected for connector in self.connectors.values())
+
+    def __getitem__(self, device: str) -> AsyncConnector:
+        return self.connectors[device]
+
+    def __iter__(self) -> Iterator[AsyncConnector]:
+        return iter(self.connectors.values())
+
+    def __len__(self) -> int:
+        return len(self.connectors)
+
+    def create_connection(self) -> None:
+        for device, connector in self.connectors.items():
+            connector.create_connection()
+            if not connector.is_connected:
+                rootLogger.error(f"Device {device} was not connected")
+
+    def close_connection(self) -> None:
+        for connector in self.connectors.values():
+            connector.close_connection()
+
+    def restart(self) -> None:
+        for connector in self.connectors.values():
+            connector.restart()
@@ -0,0 +1,174 @@
+import json
+import os
+import select
+import struct
+from time import monotonic
+from typing import BinaryIO, Dict, List, Optional, Sequence, Type, Union
+
+from communicator.binary_codec import pack, unpack
+from communicator.pending_requests import QueuedRequest
+from fc.packet_type import ConnectionMethods, RequestTypes
+from utility.logger import rootLogger
+
+
+class TextFraming:
+    """
+    JSON-сообщения, разделённые переводом строки
+    """
+
+    name = "text"
+
+    def __init__(self):
+        self._buffer = bytearray()
+
+    def encode(self, message: Union[dict, str]) -> bytes:
+        if not isinstance(message, str):
+            message = json.dumps(message)
+        return (message + "\n").encode("UTF-8")
+
+    def encode_request(self, queued_request: QueuedRequest) -> bytes:
+        return self.encode(queued_request.payload)
+
+    def decode(self, body: bytes) -> dict:
+        return json.loads(body)
+
+    def read_message(self, stream: BinaryIO) -> bytes:
+        return stream.readline()
+
+    def feed(self, data: bytes) -> List[dict]:
+        self._buffer += data
+        end = self._buffer.rfind(b"\n")
+        if end < 0:
+            return []
+        messages = bytes(self._buffer[:end])
+        del self._buffer[: end + 1]
+        return [
+            json.loads(message) for message in messages.split(b"\n") if message.strip()
+        ]
+
+
+class BinaryFraming:
+    """
+    Сообщения binary_codec с заголовком длины (uint32 little-endian)
+    """
+
+    name = "binary"
+    header = struct.Struct("<I")
+
+    def __init__(self):
+        self._buffer = bytearray()
+
+    def encode(self, message: Union[dict, str]) -> bytes:
+        if isinstance(message, str):
+            message = json.loads(message)
+        body = pack(message)
+        return self.header.pack(len(body)) + body
+
+    def encode_request(self, queued_request: QueuedRequest) -> bytes:
+        # payload, а не request: бесконечности в нём уже заменены строками
+        # (decorate_arguments), как и при текстовом формате
+        return self.encode(queued_request.payload)
+
+    def decode(self, body: bytes) -> dict:
+        return unpack(body)
+
+    def read_message(self, stream: BinaryIO) -> bytes:
+        header = stream.read(self.header.size)
+        if len(header) < self.header.size:
+            return b""
+        (size,) = self.header.unpack(header)
+        body = stream.read(size)
+        if len(body) < size:
+            # запись оборвана (например, при аварийном завершении): дальше читать нечего
+            rootLogger.warning(f"Truncated message: {len(body)} of {size} bytes")
+            return b""
+        return body
+
+    def feed(self, data: bytes) -> List[dict]:
+        self._buffer += data
+        messages = []
+        offset = 0
+        available = len(self._buffer)
+        while available - offset >= self.header.size:
+            (size,) = self.header.unpack_from(self._buffer, offset)
+            start = offset + self.header.size
+            if available - start < size:
+                break
+            messages.append(unpack(bytes(self._buffer[start : start + size])))
+            offset = start + size
+        del self._buffer[:offset]
+        return messages
+
+
+FRAMINGS: Dict[str, Type[Union[TextFraming, BinaryFraming]]] = {
+    TextFraming.name: TextFraming,
+    BinaryFraming.name: BinaryFraming,
+}
+
+
+def exchange_text_request(
+    output_fd: int, input_fd: int, request: dict, timeout: float
+) -> Optional[dict]:
+    """
+    Служебный обмен до запуска потоков соединения (только Linux): запрос
+    и ответ передаются текстом
+
+    :return: Value ответа или None, если другая сторона не ответила за timeout
+        секунд или закрыла канал
+    """
+    os.write(output_fd, TextFraming().encode(request))
+    deadline = monotonic() + timeout
+    answer = bytearray()
+    while b"\n" not in answer:
+        remaining = deadline - monotonic()
+        if remaining <= 0 or not select.select([input_fd], [], [], remaining)[0]:
+            return None
+        if not (chunk := os.read(input_fd, 4096)):
+            return None
+        answer += chunk
+    return json.loads(answer[: answer.index(b"\n")]).get("Value") or dict()
+
+
+def wait_ready(output_fd: int, input_fd: int, timeout: float) -> bool:
+    """
+    Ожидание готовности другой стороны: она должна ответить на Connection/ready
+
+    :return: True, если ответ пришёл за timeout секунд
+    """
+    request = {
+        "Type": RequestTypes.CONNECTION,
+        "Name": "connection",
+        "Method": ConnectionMethods.READY,
+        "Id": 0,
+    }
+    answer_value = exchange_text_request(output_fd, input_fd, request, timeout)
+    return bool(answer_value and answer_value.get("Ready"))
+
+
+def negotiate_framing(
+    output_fd: int, input_fd: int, modes: Sequence[str], timeout: float
+) -> str:
+    """
+    Согласование формата сообщений с другой стороной канала (только Linux)
+
+    Запрос и ответ всегда передаются текстом. Если другая сторона не ответила
+    за timeout секунд, остаётся текстовый формат
+
+    :return: имя выбранного формата из FRAMINGS
+    """
+    request = {
+        "Type": RequestTypes.CONNECTION,
+        "Name": "framing",
+        "Method": ConnectionMethods.NEGOTIATE,
+        "Arguments": {"Modes": list(modes)},
+        "Id": 0,
+    }
+    answer_value = exchange_text_request(output_fd, input_fd, request, timeout)
+    if answer_value is None:
+        rootLogger.warning("No answer for framing negotiation, using text framing")
+        return TextFraming.name
+    mode = answer_value.get("Framing", TextFraming.name)
+    if mode not in FRAMINGS:
+        mode = TextFraming.name
+    rootLogger.info(f"Negotiated {mode} framing")
+    return mode
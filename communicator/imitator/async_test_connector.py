@@ -1,7 +1,6 @@
 import threading
 from pathlib import Path
 from queue import PriorityQueue, Queue
-from time import sleep
 from typing import Optional, Union
 
 from communicator.async_communicator import AsyncConnector
@@ -9,21 +8,30 @@ from communicator.imitator.pipe_read_write import Imitator
 
 
 class AsyncConnectorTest(AsyncConnector):
+    # имитатор отвечает на Connection/ready
+    ready_handshake = True
+
     def __init__(
         self,
         request_queue: Optional[PriorityQueue] = None,
         response_queue: Optional[Queue] = None,
+        device: Optional[str] = None,
     ):
-        super().__init__(request_queue, response_queue)
-        if not hasattr(self.instance, "_imitator"):
+        super().__init__(request_queue, response_queue, device)
+        if not hasattr(self, "_imitator"):
             self.thread1: Optional[threading.Thread] = None
-            self._imitator = Imitator()
+            self._imitator = Imitator(self.output_pipe_name, self.input_pipe_name)
 
     def __new__(
         cls,
         request_queue: Optional[PriorityQueue] = None,
         response_queue: Optional[Queue] = None,
+        device: Optional[str] = None,
     ):
+        if device is not None:
+            return super(AsyncConnectorTest, cls).__new__(
+                cls, request_queue, response_queue, device
+            )
         if cls.instance is None:
             cls.instance = super(AsyncConnectorTest, cls).__new__(
                 cls, request_queue, response_queue
@@ -41,11 +49,13 @@ class AsyncConnectorTest(AsyncConnector):
         return "test", dict()
 
     def _run_async_connector(self):
+        if self.thread1 is not None:
+            # прежний имитатор завершается, получив конец файла в закрытом пайпе
+            self.thread1.join(timeout=1.0)
+        # готовность имитатора подтверждается ответом на Connection/ready
         self.thread1 = threading.Thread(target=self._imitator.start)
         self.thread1.start()
-        sleep(1)
 
     def _stop_async_connector(self):
         # self.thread1.join()
         self._imitator.stop()
-        self.thread1 = None
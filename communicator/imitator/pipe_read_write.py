@@ -4,17 +4,15 @@ import random
 import sys
 from pathlib import Path
 from threading import Thread
-from typing import Union
+from typing import Optional, Union
 
+from communicator.framing import BinaryFraming, TextFraming
+from communicator.imitator.waveforms import WaveformGenerator
+from communicator.scope_shared_memory import ScopeSharedMemory
 from fc.packet_type import (
     RequestTypes,
     OscMethods,
-    ProcedureMethods,
-    SignalMethods,
-    SettingMethods,
-    MovementsMethods,
-    StatusMethods,
-    MovementStates,
+    ConnectionMethods,
 )
 
 
@@ -26,9 +24,11 @@ if sys.platform == "win32":
 bufSize = 8192
 
 
-def create_win_pipes():
-    request_pipe_name = r"\\.\pipe\asc_tx"
-    response_pipe_name = r"\\.\pipe\asc_rx"
+def create_win_pipes(
+    request_pipe_name: str = "asc_tx", response_pipe_name: str = "asc_rx"
+):
+    request_pipe_name = "\\\\.\\pipe\\" + request_pipe_name
+    response_pipe_name = "\\\\.\\pipe\\" + response_pipe_name
     request_pipe = win32pipe.CreateNamedPipe(
         request_pipe_name,
         win32pipe.PIPE_ACCESS_INBOUND,
@@ -60,19 +60,21 @@ def create_win_pipes():
     return request_pipe, response_pipe
 
 
-def connect_linux():
-    if not Path("asc_tx").exists():
+def connect_linux(
+    request_pipe_name: str = "asc_tx", response_pipe_name: str = "asc_rx"
+):
+    if not Path(request_pipe_name).exists():
         try:
-            os.mkfifo("asc_tx")
+            os.mkfifo(request_pipe_name)
         except FileExistsError:
             pass
-    request_pipe = open("asc_tx", "r")
-    if not Path("asc_rx").exists():
+    request_pipe = open(request_pipe_name, "rb")
+    if not Path(response_pipe_name).exists():
         try:
-            os.mkfifo("asc_rx")
+            os.mkfifo(response_pipe_name)
         except FileExistsError:
             pass
-    response_pipe = open("asc_rx", "w")
+    response_pipe = open(response_pipe_name, "wb")
     return request_pipe, response_pipe
 
 
@@ -84,23 +86,36 @@ def read_from_pipe_windows(pipe) -> str:
         raise BrokenPipeError
 
 
-def read_from_pipe_linux(pipe) -> str:
+def read_from_pipe_linux(pipe) -> bytes:
     return pipe.readline()
 
 
-def write_to_pipe_windows(pipe, text: str):
+def write_to_pipe_windows(pipe, data: bytes):
     try:
-        win32file.WriteFile(pipe, bytes(text + "\n", "UTF-8"))
+        win32file.WriteFile(pipe, data)
         win32file.FlushFileBuffers(pipe)
     except pywintypes.error as exc:
         raise BrokenPipeError(exc)
 
 
-def write_to_pipe_linux(pipe, text: str):
-    pipe.writelines(text + "\n")
+def write_to_pipe_linux(pipe, data: bytes):
+    pipe.write(data)
     pipe.flush()
 
 
+def _as_list(values) -> list:
+    return values.tolist() if hasattr(values, "tolist") else list(values)
+
+
+def make_answer(request: dict, value, more: bool = False) -> dict:
+    if "Id" in request:
+        answer = {"Id": request["Id"], "Value": value}
+        if more:
+            answer["More"] = True
+        return answer
+    return {json.dumps(request): value}
+
+
 def load_settings(data):
     nodes = data.get("nodes", [])
     for node in nodes:
@@ -140,9 +155,29 @@ def load_diagrams(data):
 
 
 class Imitator:
-    def __init__(self):
+    # вывод каждого запроса и ответа в консоль; для замеров отключается
+    verbose = True
+
+    def __init__(
+        self, request_pipe_name: str = "asc_tx", response_pipe_name: str = "asc_rx"
+    ):
         self.is_running = False
+        self.request_pipe_name = request_pipe_name
+        self.response_pipe_name = response_pipe_name
+        self.current_signals_to_oscill = []
+        self.pre_trigger_time = None
+        self.post_trigger_time = None
+        self.scope_shared_memory: Optional[ScopeSharedMemory] = None
+        self.waveform_generator = WaveformGenerator()
+        self.framing = TextFraming()
+        self._next_framing = None
         self.handlers = {
+            (
+                RequestTypes.CONNECTION,
+                ConnectionMethods.NEGOTIATE,
+            ): self.handle_framing_negotiation,
+            (RequestTypes.CONNECTION, ConnectionMethods.PING): self.handle_ping,
+            (RequestTypes.CONNECTION, ConnectionMethods.READY): self.handle_ready,
             (RequestTypes.SCOPE, OscMethods.DOWNLOAD): self.handle_scope_download,
             (RequestTypes.SCOPE, OscMethods.REQUEST): self.handle_scope_request,
             (RequestTypes.SCOPE, OscMethods.SETUP): self.handle_scope_setup,
@@ -157,10 +192,16 @@ class Imitator:
 
     def start(self):
         self.is_running = True
+        # каждое подключение начинается в текстовом формате
+        self.framing = TextFraming()
+        self._next_framing = None
         self._run()
 
     def stop(self):
         self.is_running = False
+        if self.scope_shared_memory is not None:
+            self.scope_shared_memory.close()
+            self.scope_shared_memory = None
         print("Closing Imitator")
 
     def prepare_data_from_json(self, configuration_path: Union[str, Path]):
@@ -168,16 +209,29 @@ class Imitator:
         pass
 
     def prepare_oscill_answer(self):
-        pass
-        # to implement
+        time, data, trigger_index = self.waveform_generator.generate(
+            self.current_signals_to_oscill,
+            self.pre_trigger_time,
+            self.post_trigger_time,
+        )
+        return {
+            "data": dict(zip(self.current_signals_to_oscill, data)),
+            "time": time,
+            "start": float(time[0]),
+            "trigger": {"Index": trigger_index, "Time": 0.0},
+        }
 
     def _run(self):
         if sys.platform == "win32":
-            self.request_pipe, self.response_pipe = create_win_pipes()
+            self.request_pipe, self.response_pipe = create_win_pipes(
+                self.request_pipe_name, self.response_pipe_name
+            )
             self.read_from_pipe = read_from_pipe_windows
             self.write_to_pipe = write_to_pipe_windows
         else:
-            self.request_pipe, self.response_pipe = connect_linux()
+            self.request_pipe, self.response_pipe = connect_linux(
+                self.request_pipe_name, self.response_pipe_name
+            )
             self.read_from_pipe = read_from_pipe_linux
             self.write_to_pipe = write_to_pipe_linux
 
@@ -187,17 +241,26 @@ class Imitator:
             try:
                 request = self.read_from_pipe(self.request_pipe)
 
-                if not request:
-                    print(f"Empty {request = }")
+                if not request or request.isspace():
+                    if self.verbose:
+                        print(f"Empty {request = }")
                     continue
                 else:
-                    print(f"Not empty {request = }")
-                    request = json.loads(request)
-
-                answer = self.handle_request(request)
-                if answer:
-                    self.write_to_pipe(self.response_pipe, json.dumps(answer))
-                print(f"{answer = }")
+                    if self.verbose:
+                        print(f"Not empty {request = }")
+                    request = self.framing.decode(request)
+
+                answers = self.handle_request(request)
+                # потоковые обработчики возвращают генератор частей ответа
+                if isinstance(answers, dict):
+                    answers = (answers,)
+                for answer in answers or ():
+                    self.write_to_pipe(self.response_pipe, self.framing.encode(answer))
+                    if self.verbose:
+                        print(f"{answer = }")
+                if self._next_framing is not None:
+                    self.framing, self._next_framing = self._next_framing, None
+                    self.read_from_pipe = self.framing.read_message
             except BrokenPipeError as exc:
                 print(f"[{type(exc)}]: {exc}")
 
@@ -212,29 +275,118 @@ class Imitator:
 
 
 
+    def handle_framing_negotiation(self, request):
+        # двоичный формат поддерживается только на Linux
+        supported = [TextFraming.name]
+        if sys.platform != "win32":
+            supported.insert(0, BinaryFraming.name)
+        modes = request["Arguments"].get("Modes", [])
+        mode = next((mode for mode in modes if mode in supported), TextFraming.name)
+        if mode != self.framing.name:
+            self._next_framing = (
+                BinaryFraming() if mode == BinaryFraming.name else TextFraming()
+            )
+        return make_answer(request, {"Framing": mode})
+
+    def handle_ready(self, request):
+        return make_answer(request, {"Ready": True})
+
+    def handle_ping(self, request):
+        return make_answer(request, {"Pong": True})
+
     def handle_scope_download(self, request):
-        if self.current_signals_to_oscill:
-            prepared_answer = self.prepare_oscill_answer()
-            return {json.dumps(request): prepared_answer}
-        return None
+        if not self.current_signals_to_oscill:
+            return None
+        prepared_answer = self.prepare_oscill_answer()
+        chunk_samples = (request.get("Arguments") or {}).get("ChunkSamples")
+        if chunk_samples:
+            return self._stream_oscill_answer(
+                request, prepared_answer, int(chunk_samples)
+            )
+        return make_answer(request, self._publish_oscill_answer(prepared_answer))
 
     def handle_scope_request(self, request):
         if self.current_signals_to_oscill:
-            prepared_answer = self.prepare_oscill_answer()
-            return {json.dumps(request): prepared_answer}
+            prepared_answer = self._publish_oscill_answer(self.prepare_oscill_answer())
+            return make_answer(request, prepared_answer)
         return None
 
     def handle_scope_setup(self, request):
         self.current_signals_to_oscill = request["Arguments"].get("Values")
         self.pre_trigger_time = request["Arguments"].get("PreTrigger")
         self.post_trigger_time = request["Arguments"].get("PostTrigger")
+        self._attach_scope_shared_memory(request["Arguments"].get("SharedMemory"))
         if self.current_signals_to_oscill:
-            prepared_answer = self.prepare_oscill_answer()
-            return {json.dumps(request): prepared_answer}
+            prepared_answer = self._publish_oscill_answer(self.prepare_oscill_answer())
+            return make_answer(request, prepared_answer)
         return None
 
     def handle_scope_reset(self, request):
         self.current_signals_to_oscill.clear()
         self.pre_trigger_time = None
         self.post_trigger_time = None
-        return {json.dumps(request): None}
+        return make_answer(request, None)
+
+    def _attach_scope_shared_memory(self, arguments: Optional[dict]):
+        if self.scope_shared_memory is not None:
+            if arguments and arguments["Name"] == self.scope_shared_memory.name:
+                return
+            self.scope_shared_memory.close()
+            self.scope_shared_memory = None
+        if arguments:
+            self.scope_shared_memory = ScopeSharedMemory.attach(
+                arguments["Name"], arguments["Slots"], arguments["SlotSize"]
+            )
+
+    def _stream_oscill_answer(self, request, prepared_answer, chunk_samples: int):
+        time, data = prepared_answer["time"], prepared_answer["data"]
+        samples = len(time)
+        count = max(1, -(-samples // chunk_samples))
+        for index in range(count):
+            chunk = slice(index * chunk_samples, (index + 1) * chunk_samples)
+            chunk_answer = dict(
+                prepared_answer,
+                data={signal: values[chunk] for signal, values in data.items()},
+                time=time[chunk],
+                Chunk={
+                    "Index": index,
+                    "Count": count,
+                    "Offset": chunk.start,
+                    "Samples": samples,
+                },
+            )
+            # части идут в канале: без подтверждения чтения они обогнали бы
+            # потребителя по кольцу разделяемой памяти
+            yield make_answer(
+                request,
+                self._publish_oscill_answer(chunk_answer, shared=False),
+                more=index < count - 1,
+            )
+
+    def _publish_oscill_answer(self, prepared_answer, shared: bool = True):
+        # массивы кадра уходят в разделяемую память, в канал - только дескриптор
+        if not prepared_answer:
+            return prepared_answer
+        if shared and self.scope_shared_memory is not None:
+            descriptor = self.scope_shared_memory.write_frame(
+                prepared_answer["data"], prepared_answer["time"]
+            )
+            if descriptor is not None:
+                answer = {
+                    key: value
+                    for key, value in prepared_answer.items()
+                    if key not in ("data", "time")
+                }
+                answer["SharedMemory"] = descriptor
+                return answer
+        if self.framing.name == TextFraming.name:
+            # JSON не умеет NumPy-массивы, двоичный формат пакует их сам
+            prepared_answer = dict(
+                prepared_answer,
+                data={
+                    signal: _as_list(values)
+                    for signal, values in prepared_answer["data"].items()
+                },
+                time=_as_list(prepared_answer["time"]),
+            )
+        return prepared_answer
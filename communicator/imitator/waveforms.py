@@ -0,0 +1,135 @@
+from typing import Optional, Sequence, Tuple, Union
+
+import numpy as np
+
+DEFAULT_PRE_TRIGGER_TIME = 0.01
+DEFAULT_POST_TRIGGER_TIME = 0.04
+
+
+def _as_time(value: Union[str, float, None], default: float) -> float:
+    # времена приходят как числа или как строки "inf" после decorate_arguments
+    try:
+        value = float(value)
+    except (TypeError, ValueError):
+        return default
+    return value if np.isfinite(value) and value >= 0 else default
+
+
+class WaveformGenerator:
+    """
+    Векторный генератор синтетических осциллограмм для имитатора
+
+    Сигналам по кругу назначаются формы: синус, ШИМ, шум, ступенька в момент
+    триггера и импульс в момент триггера. Окно строится по PreTrigger/PostTrigger
+    с частотой sample_rate, время 0 соответствует триггеру. Детерминированная
+    часть кадра и таблица шума считаются один раз на конфигурацию, поэтому
+    каждый следующий кадр стоит одного сложения матриц
+    """
+
+    kinds = ("sine", "pwm", "noise", "step", "pulse")
+    # сдвиг окна шума между соседними сигналами
+    noise_stride = 127
+
+    def __init__(
+        self,
+        sample_rate: float = 100_000.0,
+        max_samples: int = 1_000_000,
+        noise_level: float = 0.02,
+        pwm_carrier: float = 5_000.0,
+        seed: Optional[int] = None,
+    ):
+        self.sample_rate = sample_rate
+        self.max_samples = max_samples
+        self.noise_level = noise_level
+        self.pwm_carrier = pwm_carrier
+        self.rng = np.random.default_rng(seed)
+        self._key = None
+        self._time: Optional[np.ndarray] = None
+        self._base: Optional[np.ndarray] = None
+        self._noise: Optional[np.ndarray] = None
+        self._noise_scale: Optional[np.ndarray] = None
+
+    def window(
+        self,
+        pre_trigger_time: Union[str, float, None],
+        post_trigger_time: Union[str, float, None],
+    ) -> Tuple[int, int]:
+        """
+        :return: (число точек до триггера, общее число точек)
+        """
+        pre = _as_time(pre_trigger_time, DEFAULT_PRE_TRIGGER_TIME)
+        post = _as_time(post_trigger_time, DEFAULT_POST_TRIGGER_TIME)
+        samples = int(round((pre + post) * self.sample_rate))
+        samples = max(2, min(self.max_samples, samples))
+        pre_samples = min(samples - 1, int(round(pre * self.sample_rate)))
+        return pre_samples, samples
+
+    def generate(
+        self,
+        signals: Sequence[str],
+        pre_trigger_time: Union[str, float, None],
+        post_trigger_time: Union[str, float, None],
+    ) -> Tuple[np.ndarray, np.ndarray, int]:
+        """
+        :return: (ось времени, матрица сигналы x точки, индекс точки триггера)
+        """
+        pre_samples, samples = self.window(pre_trigger_time, post_trigger_time)
+        key = (len(signals), pre_samples, samples)
+        if key != self._key:
+            self._build(len(signals), pre_samples, samples)
+            self._key = key
+        offset = int(self.rng.integers(0, samples))
+        noise = np.lib.stride_tricks.as_strided(
+            self._noise[offset:],
+            shape=self._base.shape,
+            strides=(self.noise_stride * self._noise.itemsize, self._noise.itemsize),
+            writeable=False,
+        )
+        data = np.multiply(noise, self._noise_scale[:, None])
+        data += self._base
+        return self._time, data, pre_samples
+
+    def _build(self, channels: int, pre_samples: int, samples: int) -> None:
+        time = (np.arange(samples) - pre_samples) / self.sample_rate
+        rows = np.arange(channels)
+        kinds = rows % len(self.kinds)
+        base = np.zeros((channels, samples))
+
+        sine_rows = rows[kinds == 0]
+        frequency = 50.0 * (1 + sine_rows % 7)
+        phase = 0.7 * sine_rows
+        base[sine_rows] = np.sin(
+            2 * np.pi * frequency[:, None] * time[None, :] + phase[:, None]
+        )
+
+        pwm_rows = rows[kinds == 1]
+        if pwm_rows.size:
+            carrier = 2 * np.abs(2 * ((time * self.pwm_carrier) % 1.0) - 1) - 1
+            reference = 0.8 * np.sin(
+                2 * np.pi * 50.0 * time[None, :] + 0.5 * pwm_rows[:, None]
+            )
+            base[pwm_rows] = np.where(reference > carrier[None, :], 1.0, -1.0)
+
+        step_rows = rows[kinds == 3]
+        if step_rows.size:
+            tau = 1e-3 * (1 + step_rows % 5)
+            after_trigger = np.clip(time, 0.0, None)[None, :]
+            base[step_rows] = np.where(
+                time[None, :] >= 0, 1.0 - np.exp(-after_trigger / tau[:, None]), 0.0
+            )
+
+        pulse_rows = rows[kinds == 4]
+        if pulse_rows.size:
+            width = 2e-4 * (1 + pulse_rows % 3)
+            base[pulse_rows] = np.exp(-0.5 * (time[None, :] / width[:, None]) ** 2)
+
+        noise_scale = np.full(channels, self.noise_level)
+        noise_scale[kinds == 2] = 0.3
+        # общая таблица шума: каждый сигнал берёт из неё своё окно со сдвигом
+        # noise_stride, а каждый кадр - случайное начальное смещение
+        noise = self.rng.standard_normal(2 * samples + self.noise_stride * channels)
+
+        self._time = time
+        self._base = base
+        self._noise = noise
+        self._noise_scale = noise_scale
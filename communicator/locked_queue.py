@@ -1,10 +1,43 @@
-from queue import PriorityQueue
+import heapq
+from queue import Full, PriorityQueue
+from typing import Callable, Dict, List, Optional
 
+from communicator.bounded_queue import BoundedClassesMixin, QueuePolicy
+from fc.packet_type import RequestPriority
+from utility.metrics import metrics, request_key
+
+
+class LockedPriorityQueue(BoundedClassesMixin, PriorityQueue):
+    # одинаковые (Type, Name, Method, Arguments) запросы, ещё ждущие отправки,
+    # отправляются одним запросом
+    coalesce_duplicates = True
+    # команды управления и настройки ждут места не дольше block_timeout и
+    # завершаются с queue.Full, из опросов выбрасываются самые старые
+    class_limits = {
+        RequestPriority.CONTROL: (256, QueuePolicy.BLOCK),
+        RequestPriority.SETUP: (256, QueuePolicy.BLOCK),
+        RequestPriority.POLLING: (32, QueuePolicy.DROP_OLDEST),
+    }
+    # make_request обычно вызывается из потока GUI
+    block_timeout = 1.0
 
-class LockedPriorityQueue(PriorityQueue):
     def __init__(self, *args, **kwargs):
         super(LockedPriorityQueue, self).__init__(*args, **kwargs)
+        self._init_bounds()
         self.locked = True
+        self.coalesced_count = 0
+        self._put_listeners: List[Callable[[], None]] = []
+        self._waiting: Dict[tuple, object] = dict()
+
+    def add_put_listener(self, listener: Callable[[], None]) -> None:
+        self._put_listeners.append(listener)
+
+    def remove_put_listener(self, listener: Callable[[], None]) -> None:
+        if listener in self._put_listeners:
+            self._put_listeners.remove(listener)
+
+    def is_locked(self, request: Optional[dict] = None) -> bool:
+        return self.locked
 
     def lock(self):
         self.locked = True
@@ -17,3 +50,86 @@ class LockedPriorityQueue(PriorityQueue):
             raise Exception("Queue is locked. Cannot add items.")
         else:
             super().put(*args, **kwargs)
+            for listener in self._put_listeners:
+                listener()
+
+    def requeue(self, item) -> None:
+        """
+        Возврат элемента в очередь в обход блокировки и пределов (переподключение)
+        """
+        PriorityQueue.put(self, item)
+        for listener in self._put_listeners:
+            listener()
+
+    def message_class(self, item) -> Optional[RequestPriority]:
+        return getattr(item, "priority", None)
+
+    def latest_key(self, item):
+        return item.coalesce_key()
+
+    # _put, _get и _remove_* вызываются под self.mutex
+    def _put(self, item):
+        if self.coalesce_duplicates and hasattr(item, "coalesce_key"):
+            key = item.coalesce_key()
+            if (waiting_item := self._waiting.get(key)) is not None:
+                waiting_item.attach(item)
+                if item.priority < waiting_item.priority:
+                    # срочный дубликат не должен ждать в классе ждущего запроса
+                    self._count(waiting_item, -1)
+                    waiting_item.priority = item.priority
+                    self._count(waiting_item, 1)
+                    heapq.heapify(self.queue)
+                self.coalesced_count += 1
+                # put() увеличит счётчик задач, хотя элемент в очередь не попал
+                self.unfinished_tasks -= 1
+                return
+            self._waiting[key] = item
+        self._count(item, 1)
+        super()._put(item)
+
+    def _get(self):
+        item = super()._get()
+        self._count(item, -1)
+        self._forget(item)
+        return item
+
+    def _forget(self, item) -> None:
+        if self._waiting and hasattr(item, "coalesce_key"):
+            key = item.coalesce_key()
+            if self._waiting.get(key) is item:
+                del self._waiting[key]
+
+    def _absorbs(self, item) -> bool:
+        return (
+            self.coalesce_duplicates
+            and hasattr(item, "coalesce_key")
+            and item.coalesce_key() in self._waiting
+        )
+
+    def _remove(self, item) -> None:
+        self.queue.remove(item)
+        heapq.heapify(self.queue)
+        self._forget(item)
+        self._discard(item)
+
+    def _remove_oldest(self, message_class: RequestPriority):
+        # внутри класса приоритета меньший элемент поставлен раньше
+        oldest = min(
+            item for item in self.queue if self.message_class(item) == message_class
+        )
+        self._remove(oldest)
+        return oldest
+
+    def _remove_latest(self, message_class: RequestPriority, key):
+        if self.coalesce_duplicates:
+            # ждущий дубликат и так ответит обоим
+            return None
+        for item in self.queue:
+            if self.message_class(item) == message_class and item.coalesce_key() == key:
+                self._remove(item)
+                return item
+
+    def _on_dropped(self, item) -> None:
+        if metrics.enabled:
+            metrics.increment("dropped", request_key(item.request))
+        item.set_exception(Full("Request was dropped by the queue policy"))
@@ -0,0 +1,165 @@
+import heapq
+import itertools
+import json
+import threading
+from concurrent.futures import Future, InvalidStateError
+from time import monotonic, perf_counter
+from typing import Dict, List, Optional, Tuple
+
+# порядок постановки в очередь внутри одного класса приоритета
+_sequence = itertools.count()
+
+
+class QueuedRequest:
+    __slots__ = (
+        "request_id",
+        "request",
+        "payload",
+        "future",
+        "deadline",
+        "priority",
+        "sequence",
+        "waiters",
+        "created",
+        "sent",
+        "idempotent",
+    )
+
+    def __init__(
+        self,
+        request: dict,
+        payload: str,
+        deadline: Optional[float] = None,
+        priority: int = 0,
+        idempotent: bool = False,
+    ):
+        self.request = request
+        self.request_id = request.get("Id")
+        self.payload = payload
+        self.future: Future = Future()
+        self.deadline = deadline
+        self.priority = priority
+        self.sequence = next(_sequence)
+        # одинаковые запросы, объединённые с этим, получают тот же ответ
+        self.waiters: List["QueuedRequest"] = []
+        # отметки perf_counter для метрик: постановка в очередь и отправка
+        self.created = perf_counter()
+        self.sent: Optional[float] = None
+        # повторная отправка после переподключения ничего не испортит
+        self.idempotent = idempotent
+
+    def __lt__(self, other: "QueuedRequest") -> bool:
+        # сначала класс приоритета, внутри класса - порядок постановки (FIFO)
+        return (self.priority, self.sequence) < (other.priority, other.sequence)
+
+    def __repr__(self) -> str:
+        return f"QueuedRequest({self.payload})"
+
+    def is_expired(self, now: Optional[float] = None) -> bool:
+        if self.deadline is None:
+            return False
+        return (monotonic() if now is None else now) >= self.deadline
+
+    def is_cancelled(self) -> bool:
+        return self.future.cancelled() and all(
+            waiter.future.cancelled() for waiter in self.waiters
+        )
+
+    def coalesce_key(self) -> tuple:
+        request = self.request
+        return (
+            request.get("Type"),
+            request.get("Name"),
+            request.get("Method"),
+            json.dumps(request.get("Arguments"), sort_keys=True, default=str),
+        )
+
+    def attach(self, duplicate: "QueuedRequest") -> None:
+        # у повторно отправляемого запроса могут быть свои ожидающие
+        self.waiters.extend((duplicate, *duplicate.waiters))
+        duplicate.waiters = []
+        if self.deadline is not None:
+            if duplicate.deadline is None:
+                self.deadline = None
+            else:
+                self.deadline = max(self.deadline, duplicate.deadline)
+
+    def set_result(self, value) -> None:
+        for queued_request in (self, *self.waiters):
+            try:
+                queued_request.future.set_result(value)
+            except InvalidStateError:  # запрос уже отменён или просрочен
+                pass
+
+    def set_exception(self, exc: BaseException) -> None:
+        for queued_request in (self, *self.waiters):
+            try:
+                queued_request.future.set_exception(exc)
+            except InvalidStateError:
+                pass
+
+
+class PendingRequests:
+    """
+    Таблица отправленных запросов, ожидающих ответа, с ключом по Id запроса
+
+    Запросы с дедлайном завершаются с TimeoutError, если ответ не пришёл вовремя
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._deadline_changed = threading.Condition(self._lock)
+        self._requests: Dict[int, QueuedRequest] = dict()
+        self._deadlines: List[Tuple[float, int]] = []
+        self._expire_thread: Optional[threading.Thread] = None
+
+    def __len__(self) -> int:
+        return len(self._requests)
+
+    def add(self, queued_request: QueuedRequest) -> None:
+        with self._lock:
+            self._requests[queued_request.request_id] = queued_request
+            if queued_request.deadline is not None:
+                heapq.heappush(
+                    self._deadlines,
+                    (queued_request.deadline, queued_request.request_id),
+                )
+                self._deadline_changed.notify()
+                if self._expire_thread is None:
+                    self._expire_thread = threading.Thread(
+                        target=self._expire, daemon=True
+                    )
+                    self._expire_thread.start()
+
+    def get(self, request_id: Optional[int]) -> Optional[QueuedRequest]:
+        with self._lock:
+            return self._requests.get(request_id)
+
+    def pop(self, request_id: Optional[int]) -> Optional[QueuedRequest]:
+        with self._lock:
+            return self._requests.pop(request_id, None)
+
+    def clear(self) -> List[QueuedRequest]:
+        with self._lock:
+            requests = list(self._requests.values())
+            self._requests.clear()
+            self._deadlines.clear()
+        return requests
+
+    def _expire(self):
+        while True:
+            expired = []
+            with self._lock:
+                while not self._deadlines:
+                    self._deadline_changed.wait()
+                now = monotonic()
+                while self._deadlines and self._deadlines[0][0] <= now:
+                    _, request_id = heapq.heappop(self._deadlines)
+                    if queued_request := self._requests.pop(request_id, None):
+                        expired.append(queued_request)
+                if not expired and self._deadlines:
+                    self._deadline_changed.wait(self._deadlines[0][0] - now)
+            for queued_request in expired:
+                queued_request.set_exception(
+                    TimeoutError(f"No answer for {queued_request.request}")
+                )
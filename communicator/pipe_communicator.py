@@ -1,22 +1,69 @@
+import errno
 import os
 import sys
 from abc import abstractmethod
 from pathlib import Path
-from time import sleep
-from typing import List, TextIO
+from time import monotonic, sleep
+from typing import BinaryIO, List, Optional, Sequence, Tuple, Union
 
+from communicator.framing import FRAMINGS, TextFraming, negotiate_framing, wait_ready
+from communicator.pending_requests import QueuedRequest
 from utility.logger import rootLogger
+from utility.metrics import metrics
 
 if sys.platform == "win32":
     import pywintypes
     import win32file
 
 
+def open_fifo_pair(
+    input_pipe_name: str, output_pipe_name: str, timeout: float
+) -> Tuple[int, int]:
+    """
+    Открытие пары FIFO без блокировки на open() (только Linux)
+
+    Читающий конец открывается сразу, поэтому другая сторона может открыть
+    свой пишущий конец в любом порядке. Пишущий конец открывается, как только
+    у FIFO появится читатель, но не позже timeout секунд
+
+    :return: (дескриптор чтения, дескриптор записи) в блокирующем режиме
+    """
+    for name in (input_pipe_name, output_pipe_name):
+        try:
+            os.mkfifo(name)
+        except FileExistsError:
+            pass
+    input_fd = os.open(input_pipe_name, os.O_RDONLY | os.O_NONBLOCK)
+    deadline = monotonic() + timeout
+    backoff = 0.001
+    while True:
+        try:
+            output_fd = os.open(output_pipe_name, os.O_WRONLY | os.O_NONBLOCK)
+            break
+        except OSError as exc:
+            if exc.errno != errno.ENXIO:
+                os.close(input_fd)
+                raise
+        if monotonic() >= deadline:
+            os.close(input_fd)
+            raise TimeoutError(f"Nobody opened {output_pipe_name} for reading")
+        sleep(backoff)
+        backoff = min(backoff * 2, 0.05)
+    os.set_blocking(input_fd, True)
+    os.set_blocking(output_fd, True)
+    return input_fd, output_fd
+
+
 class Pipe:
-    def __init__(self, name: [str, Path], is_input_pipe: bool):
+    def __init__(
+        self, name: [str, Path], is_input_pipe: bool, fd: Optional[int] = None
+    ):
         self.name = name
         self.is_input_pipe = is_input_pipe
-        self.pipe: [TextIO, None] = None
+        # уже открытый дескриптор (open_fifo_pair) вместо открытия по имени
+        self.fd = fd
+        self.pipe: [BinaryIO, None] = None
+        self.framing = TextFraming()
         self.connect()
 
     @abstractmethod
@@ -28,16 +75,29 @@ class Pipe:
         rootLogger.critical(f"Pipe {self.name} was disconnected")
 
     @abstractmethod
-    def write_to_pipe(self, text) -> bool:
+    def write_to_pipe(self, data: bytes) -> bool:
         return
 
     @abstractmethod
-    def read_from_pipe(self) -> [str, None]:
+    def read_from_pipe(self) -> [List[dict], None]:
         return
 
 
 class PipeLinux(Pipe):
+    read_size = 64 * 1024
+    eof_backoff_min = 0.001
+    eof_backoff_max = 0.1
+
     def connect(self):
+        self._read_buffer = bytearray(self.read_size)
+        self._read_view = memoryview(self._read_buffer)
+        self._eof_backoff = self.eof_backoff_min
+        if self.fd is not None:
+            if self.is_input_pipe:
+                self.pipe = os.fdopen(self.fd, "rb", buffering=0)
+            else:
+                self.pipe = os.fdopen(self.fd, "wb")
+            return
         if not Path(self.name).exists():
             rootLogger.warning(f"There is no {self.name} file! Creating new")
             try:
@@ -47,9 +107,9 @@ class PipeLinux(Pipe):
             ):  # может возникуть при одновременном создании пайпов имитатором или UMLConnector'ом
                 pass
         if self.is_input_pipe:
-            self.pipe = open(self.name, "r")
+            self.pipe = open(self.name, "rb", buffering=0)
         else:
-            self.pipe = open(self.name, "w")
+            self.pipe = open(self.name, "wb")
         rootLogger.success(
             f"Pipe with name = {self.name} was opened, is_input = {self.is_input_pipe}"
         )
@@ -61,18 +121,27 @@ class PipeLinux(Pipe):
             pass
         super().disconnect()
 
-    def read_from_pipe(self) -> [List[str], None]:
+    def read_from_pipe(self) -> [List[dict], None]:
         if not self.is_input_pipe or self.pipe is None:
             return None
-        while (answer := self.pipe.readline()) is None:
+        # readinto блокируется до появления данных и возвращает всё, что есть в канале
+        while (size := self.pipe.readinto(self._read_buffer)) is None:
             continue
-        return list(filter(len, [answer]))
+        if not size:
+            # у канала нет пишущей стороны: ждём её с нарастающей паузой
+            sleep(self._eof_backoff)
+            self._eof_backoff = min(self._eof_backoff * 2, self.eof_backoff_max)
+            return []
+        self._eof_backoff = self.eof_backoff_min
+        if metrics.enabled:
+            metrics.increment("bytes_in", self.name, size)
+        return self.framing.feed(self._read_view[:size])
 
-    def write_to_pipe(self, text):
+    def write_to_pipe(self, data: bytes):
         if self.is_input_pipe:
             return False
         else:
-            self.pipe.writelines(text + "\n")
+            self.pipe.write(data)
             self.pipe.flush()
             return True
 
@@ -101,23 +170,22 @@ class PipeWindows(Pipe):
             f"Pipe with name = {self.name} was opened, is_input = {self.is_input_pipe}"
         )
 
-    def read_from_pipe(self) -> [List[str], None]:
+    def read_from_pipe(self) -> [List[dict], None]:
         if not self.is_input_pipe:
             return None
         try:
             _, answer = win32file.ReadFile(self.pipe, 64 * 1024)
         except pywintypes.error as exc:
             raise BrokenPipeError(exc)
-        answer_list = answer.decode("UTF-8").split("\n")
-        answer_list = list(filter(len, answer_list))  # фильтр пустых строк
-        return answer_list
+        if metrics.enabled:
+            metrics.increment("bytes_in", self.name, len(answer))
+        return self.framing.feed(answer)
 
-    def write_to_pipe(self, text) -> bool:
+    def write_to_pipe(self, data: bytes) -> bool:
         if self.is_input_pipe:
             return False
-        text = text + "\n"
         try:
-            err, bytes_written = win32file.WriteFile(self.pipe, bytes(text, "UTF-8"))
+            err, bytes_written = win32file.WriteFile(self.pipe, data)
             win32file.FlushFileBuffers(self.pipe)
         except pywintypes.error as exc:
             raise BrokenPipeError(exc)
@@ -132,17 +200,25 @@ class PipeCommunicator:
         self.output_pipe: Pipe = Pipe(output_pipe, is_input_pipe=False)
         self.is_connected = False
 
-    def send(self, value):
+    def send(self, value: Union[dict, str]):
+        self._write(self.output_pipe.framing.encode(value))
+
+    def send_request(self, queued_request: QueuedRequest):
+        self._write(self.output_pipe.framing.encode_request(queued_request))
+
+    def _write(self, data: bytes):
         try:
             if self.is_connected:
-                self.output_pipe.write_to_pipe(value)
+                self.output_pipe.write_to_pipe(data)
+                if metrics.enabled:
+                    metrics.increment("bytes_out", self.output_pipe_name, len(data))
         except BrokenPipeError as exc:
             rootLogger.critical(
                 f"Pipe {self.output_pipe_name} was accidentally broken with error: {exc}"
             )
             self.close_connection()
 
-    def receive(self) -> [List[str], None]:
+    def receive(self) -> [List[dict], None]:
         try:
             input_message = self.input_pipe.read_from_pipe()
             return input_message
@@ -152,16 +228,50 @@ class PipeCommunicator:
             )
             self.close_connection()
 
-    def open_connection(self):
+    def open_connection(self, timeout: Optional[float] = None):
+        """
+        :param timeout: на Linux - сколько ждать другую сторону, None - открывать
+            по очереди с блокировкой, как раньше
+        """
         rootLogger.debug(sys.platform)
         if sys.platform == "win32":
             self.output_pipe = PipeWindows(self.output_pipe_name, is_input_pipe=False)
             self.input_pipe = PipeWindows(self.input_pipe_name, is_input_pipe=True)
-        else:
+        elif timeout is None:
             self.output_pipe = PipeLinux(self.output_pipe_name, is_input_pipe=False)
             self.input_pipe = PipeLinux(self.input_pipe_name, is_input_pipe=True)
+        else:
+            input_fd, output_fd = open_fifo_pair(
+                self.input_pipe_name, self.output_pipe_name, timeout
+            )
+            self.output_pipe = PipeLinux(
+                self.output_pipe_name, is_input_pipe=False, fd=output_fd
+            )
+            self.input_pipe = PipeLinux(
+                self.input_pipe_name, is_input_pipe=True, fd=input_fd
+            )
         self.is_connected = True
 
+    def wait_ready(self, timeout: float) -> bool:
+        if sys.platform == "win32":
+            return True
+        return wait_ready(
+            self.output_pipe.pipe.fileno(), self.input_pipe.pipe.fileno(), timeout
+        )
+
+    def negotiate_framing(self, modes: Sequence[str], timeout: float) -> str:
+        if sys.platform == "win32":
+            return TextFraming.name
+        mode = negotiate_framing(
+            self.output_pipe.pipe.fileno(),
+            self.input_pipe.pipe.fileno(),
+            modes,
+            timeout,
+        )
+        self.output_pipe.framing = FRAMINGS[mode]()
+        self.input_pipe.framing = FRAMINGS[mode]()
+        return mode
+
     def close_connection(self):
         self.input_pipe.disconnect()
         self.output_pipe.disconnect()
@@ -0,0 +1,143 @@
+import struct
+from multiprocessing import resource_tracker, shared_memory
+from typing import Dict, Optional, Sequence, Tuple
+
+import numpy as np
+
+from utility.logger import rootLogger
+
+# сегменты, созданные в этом процессе: их resource_tracker не должен забывать
+_created_names = set()
+
+
+class ScopeSharedMemory:
+    """
+    Кольцо слотов в разделяемой памяти для массивов осциллограммы
+
+    Слот состоит из заголовка (номер кадра, число сигналов, число точек) и
+    матрицы float64 размером (число сигналов + 1) x число точек, где нулевая
+    строка - ось времени. По каналу передаётся только дескриптор кадра.
+    Номер кадра в заголовке работает как seqlock: на время записи он
+    сбрасывается в 0, поэтому потребитель, скопировав кадр, видит, что слот
+    за это время начали перезаписывать
+    """
+
+    slot_header = struct.Struct("<QII")
+
+    def __init__(
+        self, memory: shared_memory.SharedMemory, slots: int, slot_size: int
+    ):
+        self.memory = memory
+        self.slots = slots
+        self.slot_size = slot_size
+        self._sequence = 0
+
+    @classmethod
+    def create(cls, slots: int = 4, slot_size: int = 16 * 1024 * 1024):
+        memory = shared_memory.SharedMemory(create=True, size=slots * slot_size)
+        _created_names.add(memory.name)
+        return cls(memory, slots, slot_size)
+
+    @classmethod
+    def attach(cls, name: str, slots: int, slot_size: int):
+        memory = shared_memory.SharedMemory(name=name)
+        # сегментом владеет создатель: не даём resource_tracker удалить его при
+        # выходе. В процессе создателя (Imitator) регистрация - его собственная
+        if memory.name not in _created_names:
+            resource_tracker.unregister(memory._name, "shared_memory")
+        return cls(memory, slots, slot_size)
+
+    @property
+    def name(self) -> str:
+        return self.memory.name
+
+    def arguments(self) -> dict:
+        """
+        Параметры кольца для Arguments["SharedMemory"] запроса Scope/setup
+        """
+        return {"Name": self.name, "Slots": self.slots, "SlotSize": self.slot_size}
+
+    def write_frame(
+        self, data: Dict[str, Sequence[float]], time: Sequence[float]
+    ) -> Optional[dict]:
+        """
+        Запись кадра в следующий слот кольца (сторона производителя)
+
+        :return: дескриптор кадра или None, если кадр не помещается в слот
+        """
+        signals = list(data)
+        samples = len(time)
+        size = self.slot_header.size + (len(signals) + 1) * samples * 8
+        if size > self.slot_size:
+            rootLogger.warning(
+                f"Scope frame of {size} bytes does not fit shared memory slot of {self.slot_size} bytes"
+            )
+            return None
+        self._sequence += 1
+        slot = self._sequence % self.slots
+        # номер 0 - слот перезаписывается
+        self.slot_header.pack_into(self.memory.buf, slot * self.slot_size, 0, 0, 0)
+        frame = self._frame_view(slot, len(signals) + 1, samples)
+        frame[0] = time
+        for row, signal in enumerate(signals, start=1):
+            frame[row] = data[signal]
+        # номер кадра публикуется последним: по нему потребитель проверяет слот
+        self.slot_header.pack_into(
+            self.memory.buf,
+            slot * self.slot_size,
+            self._sequence,
+            len(signals),
+            samples,
+        )
+        return {
+            "Name": self.name,
+            "Slot": slot,
+            "Sequence": self._sequence,
+            "Signals": signals,
+            "Samples": samples,
+        }
+
+    def read_frame(
+        self, descriptor: dict
+    ) -> Optional[Tuple[np.ndarray, np.ndarray]]:
+        """
+        Копия кадра по дескриптору (сторона потребителя)
+
+        :return: (матрица сигналов в порядке descriptor["Signals"], ось времени)
+            или None, если слот перезаписан до или во время копирования
+        """
+        slot = descriptor["Slot"]
+        if not self._slot_holds(slot, descriptor["Sequence"]):
+            return None
+        signals = descriptor["Signals"]
+        frame = self._frame_view(slot, len(signals) + 1, descriptor["Samples"]).copy()
+        # номер проверяется снова: за время копирования слот мог начать перезапись
+        if not self._slot_holds(slot, descriptor["Sequence"]):
+            return None
+        return frame[1:], frame[0]
+
+    def _slot_holds(self, slot: int, expected_sequence: int) -> bool:
+        sequence, _, _ = self.slot_header.unpack_from(
+            self.memory.buf, slot * self.slot_size
+        )
+        if sequence != expected_sequence:
+            rootLogger.warning(
+                f"Scope frame {expected_sequence} was overwritten by frame {sequence}"
+            )
+            return False
+        return True
+
+    def _frame_view(self, slot: int, rows: int, samples: int) -> np.ndarray:
+        return np.ndarray(
+            (rows, samples),
+            dtype="<f8",
+            buffer=self.memory.buf,
+            offset=slot * self.slot_size + self.slot_header.size,
+        )
+
+    def close(self) -> None:
+        self.memory.close()
+
+    def unlink(self) -> None:
+        self.memory.unlink()
+        _created_names.discard(self.memory.name)
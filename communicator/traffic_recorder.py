@@ -0,0 +1,134 @@
+import json
+import threading
+from pathlib import Path
+from time import monotonic, perf_counter, sleep
+from typing import BinaryIO, Dict, Iterator, Optional, Tuple, Union
+
+from communicator.framing import BinaryFraming
+from utility.logger import rootLogger
+
+FILE_MAGIC = b"FCTRAFF1"
+SENT = "tx"
+RECEIVED = "rx"
+
+
+class TrafficRecorder:
+    """
+    Запись обмена AsyncConnector в файл: отправленные запросы и полученные
+    ответы с отметкой времени от начала записи
+
+    Записи - сообщения BinaryFraming вида {"Time", "Direction", "Message"},
+    поэтому массивы осциллограмм сохраняются без перевода в текст. При обмене
+    через разделяемую память в файл попадают только дескрипторы кадров, для
+    последующего воспроизведения разделяемую память лучше не включать
+    """
+
+    def __init__(self, path: Union[str, Path]):
+        self.path = Path(path)
+        self.records_written = 0
+        self._framing = BinaryFraming()
+        self._lock = threading.Lock()
+        self._file: Optional[BinaryIO] = open(self.path, "wb")
+        self._file.write(FILE_MAGIC)
+        self._started = monotonic()
+        rootLogger.info(f"Recording traffic to {self.path}")
+
+    def record(self, direction: str, message: dict) -> None:
+        record = {
+            "Time": monotonic() - self._started,
+            "Direction": direction,
+            "Message": message,
+        }
+        data = self._framing.encode(record)
+        with self._lock:
+            if self._file is not None:
+                self._file.write(data)
+                self.records_written += 1
+
+    def close(self) -> None:
+        with self._lock:
+            if self._file is not None:
+                self._file.close()
+                self._file = None
+
+
+def read_traffic(path: Union[str, Path]) -> Iterator[Tuple[float, str, dict]]:
+    """
+    :return: записи файла TrafficRecorder в виде (время, направление, сообщение)
+    """
+    framing = BinaryFraming()
+    with open(path, "rb") as file:
+        if file.read(len(FILE_MAGIC)) != FILE_MAGIC:
+            raise ValueError(f"{path} is not a traffic capture")
+        while body := framing.read_message(file):
+            record = framing.decode(body)
+            yield record["Time"], record["Direction"], record["Message"]
+
+
+class ReplayConnector:
+    """
+    Воспроизведение записанного обмена через обработчик ответов
+    ResponseManager._manage_answers без устройства и JsonRpcPipesConnector
+
+    Ответы сопоставляются с запросами так же, как в AsyncConnector: по Id или
+    по запросу-ключу в старом формате. speed=None - максимальная скорость,
+    1.0 - исходные интервалы, 2.0 - вдвое быстрее
+    """
+
+    def __init__(
+        self,
+        path: Union[str, Path],
+        response_manager,
+        speed: Optional[float] = None,
+    ):
+        self.path = Path(path)
+        self.response_manager = response_manager
+        self.speed = speed
+
+    def run(self) -> dict:
+        """
+        :return: статистика воспроизведения
+        """
+        sent_requests: Dict[int, dict] = dict()
+        answers = 0
+        unmatched = 0
+        processing = 0.0
+        started = perf_counter()
+        for record_time, direction, message in read_traffic(self.path):
+            if self.speed:
+                delay = record_time / self.speed - (perf_counter() - started)
+                if delay > 0:
+                    sleep(delay)
+            if direction == SENT:
+                sent_requests[message.get("Id")] = message
+                continue
+            request, value = self._match(message, sent_requests)
+            if request is None:
+                unmatched += 1
+                continue
+            handling_started = perf_counter()
+            self.response_manager._manage_answers(request, value)
+            processing += perf_counter() - handling_started
+            answers += 1
+        elapsed = perf_counter() - started
+        return {
+            "answers": answers,
+            "unmatched": unmatched,
+            "elapsed_s": elapsed,
+            "answers_per_second": answers / elapsed if elapsed else 0.0,
+            "processing_ms_per_answer": 1e3 * processing / answers if answers else 0.0,
+        }
+
+    @staticmethod
+    def _match(
+        answer: dict, sent_requests: Dict[int, dict]
+    ) -> Tuple[Optional[dict], object]:
+        if "Id" in answer:
+            if answer.get("More", False):
+                request = sent_requests.get(answer["Id"])
+            else:
+                request = sent_requests.pop(answer["Id"], None)
+            return request, answer.get("Value")
+        # старый формат ответа: {json.dumps(request): value}
+        (request, value), = answer.items()
+        return json.loads(request), value
@@ -0,0 +1,246 @@
+import json
+import mmap
+import struct
+import threading
+import time as wall_clock
+from pathlib import Path
+from typing import BinaryIO, Iterator, List, Optional, Sequence, Union
+
+import numpy as np
+
+from fc.scope_frame import ScopeFrame
+from utility.logger import rootLogger
+
+FILE_MAGIC = b"FCCAPTUR"
+INDEX_MAGIC = b"FCINDEX\0"
+BLOCK_MAGIC = b"FRME"
+VERSION = 1
+
+# заголовок файла: метка, версия, размер значения, длина JSON-описания
+_file_header = struct.Struct("<8sHHI")
+# заголовок кадра: метка, число сигналов, число точек, время записи, start
+_block_header = struct.Struct("<4sIQdd")
+# окончание файла: смещение индекса, число кадров, метка
+_footer = struct.Struct("<QQ8s")
+_index_dtype = np.dtype([("offset", "<u8"), ("samples", "<u8"), ("wall", "<f8")])
+
+
+def _padding(size: int) -> int:
+    return -size % 8
+
+
+class CaptureRecorder:
+    """
+    Непрерывная запись кадров осциллограммы в компактный двоичный файл
+
+    Формат: заголовок с JSON-описанием (сигналы, частота дискретизации, тип
+    значений), затем кадры - заголовок, ось времени float64 и матрица значений
+    сигнал за сигналом в float32 или float64, в конце индекс смещений кадров.
+    Всё выровнено на 8 байт, поэтому CaptureReader отдаёт кадры представлениями
+    поверх mmap. Файл привязан к одному набору сигналов: при смене набора запись
+    продолжается в следующий файл (capture.1.fccap, capture.2.fccap, ...)
+    """
+
+    def __init__(
+        self,
+        path: Union[str, Path],
+        dtype: Union[str, np.dtype] = np.float32,
+        name: Optional[str] = None,
+    ):
+        """
+        :param path: путь первого файла записи
+        :param dtype: тип значений сигналов в файле, float32 или float64
+        :param name: записывать только кадры осциллографа с этим именем
+        """
+        self.path = Path(path)
+        self.dtype = np.dtype(dtype).newbyteorder("<")
+        if self.dtype.kind != "f" or self.dtype.itemsize not in (4, 8):
+            raise ValueError(f"Unsupported capture dtype {dtype}")
+        self.name = name
+        self.paths: List[Path] = []
+        self.frames_written = 0
+        self._file: Optional[BinaryIO] = None
+        self._signals: Optional[Sequence[str]] = None
+        self._index: List[tuple] = []
+        # запись идёт из потока ResponseManager, остановка - обычно из GUI
+        self._lock = threading.Lock()
+        # после close поток ResponseManager может ещё держать ссылку на запись:
+        # новый файл из-за этого открываться не должен
+        self._closed = False
+
+    def write(self, frame: ScopeFrame) -> None:
+        if self.name is not None and frame.name != self.name:
+            return
+        with self._lock:
+            if not self._closed:
+                self._write(frame)
+
+    def close(self) -> None:
+        with self._lock:
+            self._closed = True
+            self._close()
+
+    def _write(self, frame: ScopeFrame) -> None:
+        if self._file is None or frame.signals != self._signals:
+            self._open(frame)
+        offset = self._file.tell()
+        wall = wall_clock.time()
+        data = np.ascontiguousarray(frame.data, dtype=self.dtype)
+        self._file.write(
+            _block_header.pack(
+                BLOCK_MAGIC, frame.channels, frame.samples, wall, frame.start or 0.0
+            )
+        )
+        self._file.write(np.ascontiguousarray(frame.time, dtype="<f8").data)
+        self._file.write(data.data)
+        self._file.write(b"\0" * _padding(data.nbytes))
+        self._index.append((offset, frame.samples, wall))
+        self.frames_written += 1
+
+    def _close(self) -> None:
+        if self._file is None:
+            return
+        index_offset = self._file.tell()
+        self._file.write(np.array(self._index, dtype=_index_dtype).tobytes())
+        self._file.write(_footer.pack(index_offset, len(self._index), INDEX_MAGIC))
+        self._file.close()
+        self._file = None
+        self._index = []
+
+    def _open(self, frame: ScopeFrame) -> None:
+        self._close()
+        if self.paths:
+            path = self.path.with_name(
+                f"{self.path.stem}.{len(self.paths)}{self.path.suffix}"
+            )
+        else:
+            path = self.path
+        description = json.dumps(
+            {
+                "Name": frame.name,
+                "Signals": list(frame.signals),
+                "SampleRate": _sample_rate(frame.time),
+                "Dtype": self.dtype.str,
+            }
+        ).encode()
+        self._file = open(path, "wb")
+        self._file.write(
+            _file_header.pack(
+                FILE_MAGIC, VERSION, self.dtype.itemsize, len(description)
+            )
+        )
+        self._file.write(description)
+        self._file.write(b"\0" * _padding(_file_header.size + len(description)))
+        self._signals = frame.signals
+        self.paths.append(path)
+        rootLogger.info(f"Recording scope captures to {path}")
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+
+def _sample_rate(time: np.ndarray) -> Optional[float]:
+    if time.size < 2 or time[-1] == time[0]:
+        return None
+    return float((time.size - 1) / (time[-1] - time[0]))
+
+
+class CaptureReader:
+    """
+    Чтение файла CaptureRecorder через mmap: открытие не загружает данные,
+    кадры отдаются представлениями только для чтения
+
+    Если запись оборвалась и индекса в конце нет, он восстанавливается
+    проходом по заголовкам кадров
+    """
+
+    def __init__(self, path: Union[str, Path]):
+        self.path = Path(path)
+        with open(self.path, "rb") as file:
+            self._mmap = mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ)
+        magic, version, itemsize, description_size = _file_header.unpack_from(
+            self._mmap, 0
+        )
+        if magic != FILE_MAGIC or version != VERSION:
+            raise ValueError(f"{self.path} is not a capture file")
+        description_end = _file_header.size + description_size
+        description = json.loads(self._mmap[_file_header.size : description_end])
+        self.name: str = description["Name"]
+        self.signals: List[str] = description["Signals"]
+        self.sample_rate: Optional[float] = description["SampleRate"]
+        self.dtype = np.dtype(description["Dtype"])
+        self._data_offset = description_end + _padding(description_end)
+        self.index = self._read_index()
+
+    def __len__(self) -> int:
+        return len(self.index)
+
+    @property
+    def wall_times(self) -> np.ndarray:
+        return self.index["wall"]
+
+    def frame(self, number: int) -> ScopeFrame:
+        offset = int(self.index["offset"][number])
+        _, channels, samples, _, start = _block_header.unpack_from(self._mmap, offset)
+        offset += _block_header.size
+        time = np.frombuffer(self._mmap, "<f8", samples, offset)
+        offset += samples * 8
+        data = np.frombuffer(self._mmap, self.dtype, channels * samples, offset)
+        return ScopeFrame(
+            data.reshape(channels, samples), time, self.signals, start, name=self.name
+        )
+
+    def frames_between(
+        self, start_wall: float, end_wall: float
+    ) -> Iterator[ScopeFrame]:
+        """
+        Кадры, записанные в интервале [start_wall, end_wall] по time.time()
+        """
+        first = int(np.searchsorted(self.wall_times, start_wall, side="left"))
+        last = int(np.searchsorted(self.wall_times, end_wall, side="right"))
+        for number in range(first, last):
+            yield self.frame(number)
+
+    def __iter__(self) -> Iterator[ScopeFrame]:
+        for number in range(len(self)):
+            yield self.frame(number)
+
+    def close(self) -> None:
+        self.index = np.empty(0, dtype=_index_dtype)
+        try:
+            self._mmap.close()
+        except BufferError:
+            # снаружи ещё живут кадры-представления: mmap закроется вместе с ними
+            pass
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def _read_index(self) -> np.ndarray:
+        size = len(self._mmap)
+        if size >= self._data_offset + _footer.size:
+            index_offset, count, magic = _footer.unpack_from(
+                self._mmap, size - _footer.size
+            )
+            if magic == INDEX_MAGIC:
+                return np.frombuffer(self._mmap, _index_dtype, count, index_offset)
+        rootLogger.warning(f"Capture {self.path} has no index, scanning frames")
+        entries = []
+        offset = self._data_offset
+        while offset + _block_header.size <= size:
+            magic, channels, samples, wall, _ = _block_header.unpack_from(
+                self._mmap, offset
+            )
+            data_size = channels * samples * self.dtype.itemsize
+            end = offset + _block_header.size + samples * 8 + data_size
+            if magic != BLOCK_MAGIC or end > size:
+                break
+            entries.append((offset, samples, wall))
+            offset = end + _padding(data_size)
+        return np.array(entries, dtype=_index_dtype)
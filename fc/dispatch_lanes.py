@@ -0,0 +1,90 @@
+import threading
+from queue import Queue
+from typing import Any, Callable, Dict, Hashable, List, Optional
+
+from communicator.bounded_queue import ResponseQueue
+from utility.logger import rootLogger
+
+
+def _lane_name(lane: Hashable) -> str:
+    return "default" if lane is None else str(getattr(lane, "value", lane))
+
+
+class DispatchLanes:
+    """
+    Обработка ответов по полосам: у каждого типа запроса (Type) свои потоки,
+    поэтому тяжёлая обработка осциллограмм не задерживает ответы на команды
+    управления
+
+    Внутри полосы ответ достаётся потоку по ключу (Type, Device, Name), так что
+    ответы с одним ключом обрабатываются по порядку. Типы без своей полосы
+    идут в полосу None. Очереди полос - ResponseQueue с теми же пределами,
+    что и у исходной очереди ответов
+    """
+
+    def __init__(
+        self,
+        handler: Callable[[dict, Any], None],
+        lanes: Dict[Hashable, int],
+        queue_factory: Callable[[], Queue] = ResponseQueue,
+    ):
+        """
+        :param handler: обработчик (запрос, значение), вызывается в потоках полос
+        :param lanes: тип запроса -> число потоков полосы
+        """
+        self.handler = handler
+        self._workers: Dict[Hashable, List[Queue]] = dict()
+        for lane, threads in {None: 1, **lanes}.items():
+            self._workers[lane] = [queue_factory() for _ in range(max(1, threads))]
+            for index, lane_queue in enumerate(self._workers[lane]):
+                threading.Thread(
+                    target=self._work,
+                    args=(lane_queue,),
+                    name=f"ResponseLane-{_lane_name(lane)}-{index}",
+                    daemon=True,
+                ).start()
+
+    def dispatch(self, request: dict, value: Any) -> None:
+        workers = self._workers.get(request.get("Type")) or self._workers[None]
+        if len(workers) == 1:
+            lane_queue = workers[0]
+        else:
+            key = (request.get("Device"), request.get("Name"))
+            lane_queue = workers[hash(key) % len(workers)]
+        lane_queue.put((request, value))
+
+    def _work(self, lane_queue: Queue) -> None:
+        while True:
+            request, value = lane_queue.get()
+            try:
+                self.handler(request, value)
+            except Exception:
+                # ошибка одного ответа не должна останавливать полосу
+                rootLogger.exception(f"Failed to handle answer for {request = }")
+            finally:
+                lane_queue.task_done()
+
+    def depths(self) -> Dict[str, int]:
+        """
+        :return: число ждущих ответов по потокам полос, "Scope/0", "Scope/1", ...
+        """
+        return {
+            f"{_lane_name(lane)}/{index}": lane_queue.qsize()
+            for lane, workers in self._workers.items()
+            for index, lane_queue in enumerate(workers)
+        }
+
+    def stats(self) -> Dict[str, Optional[dict]]:
+        return {
+            f"{_lane_name(lane)}/{index}": getattr(lane_queue, "stats", lambda: None)()
+            for lane, workers in self._workers.items()
+            for index, lane_queue in enumerate(workers)
+        }
+
+    def join(self) -> None:
+        """
+        Ожидание обработки всех ответов, уже разведённых по полосам
+        """
+        for workers in self._workers.values():
+            for lane_queue in workers:
+                lane_queue.join()
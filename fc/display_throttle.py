@@ -0,0 +1,106 @@
+import threading
+from typing import Dict, Optional
+
+import numpy as np
+from PyQt5.QtCore import QObject, Qt, QTimer, pyqtSignal
+
+from fc.scope_frame import ScopeFrame
+
+
+def decimate_min_max(frame: ScopeFrame, buckets: int) -> ScopeFrame:
+    """
+    Прореживание кадра до 2 * buckets точек: для каждого интервала остаются
+    минимум и максимум каждого сигнала, поэтому короткие выбросы не теряются
+
+    Минимум ставится на начало интервала, максимум - на конец: на ширине
+    одного пикселя порядок точек внутри интервала не виден
+    """
+    if buckets <= 0 or frame.samples <= 2 * buckets:
+        return frame
+    edges = np.linspace(0, frame.samples, buckets + 1).astype(np.intp)
+    starts = edges[:-1]
+    data = np.empty((frame.channels, 2 * buckets))
+    data[:, 0::2] = np.minimum.reduceat(frame.data, starts, axis=1)
+    data[:, 1::2] = np.maximum.reduceat(frame.data, starts, axis=1)
+    time = np.empty(2 * buckets)
+    time[0::2] = frame.time[starts]
+    time[1::2] = frame.time[edges[1:] - 1]
+    return ScopeFrame(
+        data,
+        time,
+        frame.signals,
+        frame.start,
+        name=frame.name,
+        trigger=frame.trigger,
+        offset=frame.offset,
+    )
+
+
+class DisplayThrottle(QObject):
+    """
+    Ступень между ResponseManager и графиками
+
+    Кадры принимаются с любой частотой из любого потока, но для каждого
+    осциллографа хранится только последний: вытесненные кадры отбрасываются.
+    Таймер в потоке объекта (обычно GUI, запускается start) refresh_rate раз
+    в секунду прореживает накопившиеся кадры до ширины графика и отправляет
+    их в frame_ready.
+    Полный кадр остаётся доступен через full_frame. Для кадров из разделяемой
+    памяти это представление, которое действительно, пока кольцо не пройдено
+    по кругу
+    """
+
+    frame_ready = pyqtSignal(object)  # прореженный ScopeFrame
+
+    def __init__(self, refresh_rate: float = 30.0, width: int = 1000):
+        super(QObject, DisplayThrottle).__init__(self)
+        self.width = width
+        self.dropped_frames = 0
+        self._lock = threading.Lock()
+        self._waiting: Dict[str, ScopeFrame] = dict()
+        self._full_frames: Dict[str, ScopeFrame] = dict()
+        self._timer = QTimer(self)
+        self._timer.timeout.connect(self.flush)
+        self.set_refresh_rate(refresh_rate)
+
+    def attach(self, response_manager) -> None:
+        # прямое подключение: приём кадра - только запись под блокировкой
+        response_manager.oscill_frame_signal.connect(self.submit, Qt.DirectConnection)
+
+    def detach(self, response_manager) -> None:
+        response_manager.oscill_frame_signal.disconnect(self.submit)
+
+    def set_refresh_rate(self, refresh_rate: float) -> None:
+        self._timer.setInterval(max(1, int(round(1000 / refresh_rate))))
+
+    def set_width(self, width: int) -> None:
+        """
+        :param width: ширина графика в пикселях
+        """
+        self.width = width
+
+    def start(self) -> None:
+        self._timer.start()
+
+    def stop(self) -> None:
+        self._timer.stop()
+
+    def submit(self, frame: ScopeFrame) -> None:
+        with self._lock:
+            if frame.name in self._waiting:
+                self.dropped_frames += 1
+            self._waiting[frame.name] = frame
+            self._full_frames[frame.name] = frame
+
+    def full_frame(self, name: str = "") -> Optional[ScopeFrame]:
+        """
+        Последний полученный кадр осциллографа без прореживания
+        """
+        with self._lock:
+            return self._full_frames.get(name)
+
+    def flush(self) -> None:
+        with self._lock:
+            frames, self._waiting = self._waiting, dict()
+        for frame in frames.values():
+            self.frame_ready.emit(decimate_min_max(frame, self.width // 2))
@@ -1,24 +1,88 @@
-import json
-from typing import Dict, Optional
+import asyncio
+import itertools
+from concurrent.futures import Future
+from queue import Full
+from time import monotonic
+from typing import Dict, Optional, Tuple
 
 from fc.packet_type import *
 from communicator.locked_queue import LockedPriorityQueue
-from utility.logger import rootLogger
+from communicator.pending_requests import QueuedRequest
+from utility.json_encoder import command_encoder, decorate_arguments
+from utility.logger import lazyLogger, short_repr
+from utility.metrics import metrics, request_key
 
+_request_ids = itertools.count(1)
 
-def decorate_arguments(arguments_dict: dict) -> dict:
-    decorated_dict = dict()
-    for key, val in arguments_dict.items():
-        if val in (float("inf"), float("-inf")):
-            decorated_dict[key] = str(val)
-        elif isinstance(val, dict):
-            decorated_dict[key] = decorate_arguments(val)
-        else:
-            decorated_dict[key] = val
-    return decorated_dict
+request_priorities = {
+    (RequestTypes.SCOPE, OscMethods.RESET): RequestPriority.CONTROL,
+    (RequestTypes.SCOPE, OscMethods.SETUP): RequestPriority.SETUP,
+    (RequestTypes.SCOPE, OscMethods.REQUEST): RequestPriority.POLLING,
+    (RequestTypes.SCOPE, OscMethods.DOWNLOAD): RequestPriority.POLLING,
+    (RequestTypes.CONNECTION, ConnectionMethods.PING): RequestPriority.CONTROL,
+}
+
+# запросы, которые можно повторить после переподключения, если ответ не пришёл;
+# reset и всё, чего нет в таблице, при обрыве завершается с ConnectionError
+idempotent_requests = {
+    (RequestTypes.SCOPE, OscMethods.SETUP),
+    (RequestTypes.SCOPE, OscMethods.REQUEST),
+    (RequestTypes.SCOPE, OscMethods.DOWNLOAD),
+    (RequestTypes.CONNECTION, ConnectionMethods.PING),
+}
+
+
+class CommandTemplate:
+    """
+    Заготовка команды с постоянными Type, Name, Method и Device: эта часть JSON
+    кодируется один раз, при каждом запросе кодируются только Arguments
+
+    Ключи идут в том же порядке, что и в make_command. Device остаётся только
+    в словаре команды, в JSON его нет (см. _wire_request)
+    """
+
+    __slots__ = ("command", "device", "_head")
+
+    def __init__(self, command_type: RequestTypes, name, method, device=None):
+        self.command = {"Type": command_type, "Name": name, "Method": method}
+        self.device = device
+        # JSON словаря без закрывающей скобки
+        self._head = command_encoder.encode(self.command, decorate=False)[:-1]
+
+    def render(self, arguments=None, decorate: bool = True) -> Tuple[dict, str]:
+        """
+        :return: команда, как от make_command, и её JSON
+        """
+        request = dict(self.command)
+        parts = [self._head]
+        if arguments is not None:
+            request["Arguments"] = arguments
+            parts.append(', "Arguments": ')
+            parts.append(command_encoder.encode(arguments, decorate))
+        if self.device is not None:
+            request["Device"] = self.device
+        request["Id"] = request_id = next(_request_ids)
+        parts.append(f', "Id": {request_id}}}')
+        return request, "".join(parts)
+
+
+_templates: Dict[tuple, CommandTemplate] = dict()
+
+
+def _wire_request(async_request: Dict) -> Dict:
+    """
+    Команда без "Device": ключ нужен только для выбора соединения пула и
+    имени кадров, JsonRpcPipesConnector устройства о нём не знает
+    """
+    if "Device" not in async_request:
+        return async_request
+    return {key: value for key, value in async_request.items() if key != "Device"}
 
 
 class FC_Controls:
+    # срок жизни опросов по умолчанию: устаревшие опросы не отправляются
+    polling_timeout: Optional[float] = None
+
     def __init__(self):
         self.request_queue: Optional[LockedPriorityQueue] = None
 
@@ -26,20 +90,153 @@ class FC_Controls:
         self.request_queue = request_queue
 
     @staticmethod
-    def make_command(command_type: RequestTypes, name, method, arguments=None):
+    def make_command(
+        command_type: RequestTypes, name, method, arguments=None, device=None
+    ):
         final_request = {"Type": command_type, "Name": name, "Method": method}
         if arguments is not None:
             final_request["Arguments"] = arguments
+        # устройство пула ConnectorPool, которому адресована команда
+        if device is not None:
+            final_request["Device"] = device
+        final_request["Id"] = next(_request_ids)
         return final_request
 
-    def make_request(self, async_request: Dict):
-        if not self.request_queue.locked:
-            prepared_request = json.dumps(decorate_arguments(async_request))
-            rootLogger.debug(f"{prepared_request = }")
-            self.request_queue.put(prepared_request)
-
-    def make_request_without_decorate(self, async_request: Dict):
-        if not self.request_queue.locked:
-            prepared_request = json.dumps(async_request)
-            rootLogger.debug(f"{prepared_request = }")
-            self.make_request(async_request)
\ No newline at end of file
+    @staticmethod
+    def command_template(
+        command_type: RequestTypes, name, method, device=None
+    ) -> CommandTemplate:
+        """
+        Заготовка для частых одинаковых команд с разными Arguments, например
+        при переборе параметров. Заготовки кешируются
+        """
+        key = (command_type, name, method, device)
+        if (template := _templates.get(key)) is None:
+            template = _templates[key] = CommandTemplate(*key)
+        return template
+
+    def make_request(
+        self,
+        async_request: Dict,
+        timeout: Optional[float] = None,
+        priority: Optional[RequestPriority] = None,
+        idempotent: Optional[bool] = None,
+    ) -> Future:
+        """
+        Постановка запроса в очередь отправки
+
+        :param async_request: команда, собранная make_command
+        :param timeout: время ожидания ответа в секундах, None - без ограничения.
+            Для опросов по умолчанию берётся polling_timeout
+        :param priority: класс приоритета, по умолчанию из request_priorities
+        :param idempotent: повторять ли запрос после переподключения, по умолчанию
+            из idempotent_requests
+        :return: Future, который завершится значением ответа. Сигналы ResponseManager
+            при этом продолжают работать
+        """
+        if (rejected := self._reject(async_request)) is not None:
+            return rejected
+        return self._enqueue(
+            async_request,
+            command_encoder.encode(_wire_request(async_request)),
+            timeout,
+            priority,
+            idempotent,
+        )
+
+    def make_template_request(
+        self,
+        template: CommandTemplate,
+        arguments=None,
+        timeout: Optional[float] = None,
+        priority: Optional[RequestPriority] = None,
+        idempotent: Optional[bool] = None,
+    ) -> Future:
+        """
+        make_request для команды из заготовки command_template
+        """
+        async_request, prepared_request = template.render(arguments)
+        if (rejected := self._reject(async_request)) is not None:
+            return rejected
+        return self._enqueue(
+            async_request, prepared_request, timeout, priority, idempotent
+        )
+
+    def _reject(self, async_request: Dict) -> Optional[Future]:
+        """
+        :return: Future с ошибкой, если запрос нельзя поставить в очередь
+        """
+        try:
+            locked = self.request_queue.is_locked(async_request)
+        except ValueError as exc:
+            # устройство не из пула (DeviceRoutingQueue)
+            return self._failed(async_request, exc)
+        if locked:
+            return self._failed(
+                async_request, ConnectionError("Request queue is locked")
+            )
+        return None
+
+    @staticmethod
+    def _failed(async_request: Dict, exc: BaseException) -> Future:
+        if metrics.enabled:
+            metrics.increment("rejected", request_key(async_request))
+        future = Future()
+        future.set_exception(exc)
+        return future
+
+    def _enqueue(
+        self,
+        async_request: Dict,
+        prepared_request: str,
+        timeout: Optional[float],
+        priority: Optional[RequestPriority],
+        idempotent: Optional[bool],
+    ) -> Future:
+        lazyLogger.debug("prepared_request = {}", lambda: short_repr(prepared_request))
+        key = (async_request.get("Type"), async_request.get("Method"))
+        if priority is None:
+            priority = request_priorities.get(key, RequestPriority.SETUP)
+        if idempotent is None:
+            idempotent = key in idempotent_requests
+        if timeout is None and priority == RequestPriority.POLLING:
+            timeout = self.polling_timeout
+        deadline = None if timeout is None else monotonic() + timeout
+        queued_request = QueuedRequest(
+            async_request, prepared_request, deadline, priority, idempotent
+        )
+        try:
+            self.request_queue.put(queued_request)
+        except Full as exc:
+            # предел класса приоритета занят (LockedPriorityQueue.class_limits)
+            if metrics.enabled:
+                metrics.increment("rejected", request_key(async_request))
+            queued_request.set_exception(exc)
+            return queued_request.future
+        if metrics.enabled:
+            metrics.increment("requests", request_key(async_request))
+        return queued_request.future
+
+    def make_request_async(
+        self,
+        async_request: Dict,
+        timeout: Optional[float] = None,
+        priority: Optional[RequestPriority] = None,
+    ) -> asyncio.Future:
+        return asyncio.wrap_future(self.make_request(async_request, timeout, priority))
+
+    def make_request_without_decorate(
+        self,
+        async_request: Dict,
+        timeout: Optional[float] = None,
+        priority: Optional[RequestPriority] = None,
+    ) -> Future:
+        if (rejected := self._reject(async_request)) is not None:
+            return rejected
+        return self._enqueue(
+            async_request,
+            command_encoder.encode(_wire_request(async_request), decorate=False),
+            timeout,
+            priority,
+            None,
+        )
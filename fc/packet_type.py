@@ -1,8 +1,9 @@
-from enum import Enum
+from enum import Enum, IntEnum
 
 
 class RequestTypes(str, Enum):
     SCOPE = "Scope"
+    CONNECTION = "Connection"
 
 
 class OscMethods(str, Enum):
@@ -10,3 +11,19 @@ class OscMethods(str, Enum):
     DOWNLOAD = "download"
     SETUP = "setup"
     RESET = "reset"
+
+
+class ConnectionMethods(str, Enum):
+    NEGOTIATE = "negotiate"
+    PING = "ping"
+    READY = "ready"
+
+
+class RequestPriority(IntEnum):
+    """
+    Классы приоритета запросов: меньшее значение отправляется раньше
+    """
+
+    CONTROL = 0
+    SETUP = 1
+    POLLING = 2
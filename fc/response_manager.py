@@ -1,20 +1,54 @@
 import threading
 from queue import Queue
+from time import perf_counter
+from typing import Dict, Optional, Sequence, Tuple
 
+import numpy as np
 from PyQt5.QtCore import QObject, pyqtSignal
 
+from communicator.bounded_queue import ResponseQueue
+from communicator.scope_shared_memory import ScopeSharedMemory
+from fc.capture_recorder import CaptureRecorder
+from fc.dispatch_lanes import DispatchLanes
 from fc.packet_type import (
     OscMethods,
     RequestTypes,
 )
-from utility.logger import rootLogger
+from fc.scope_analytics import DEFAULT_METRICS, ScopeAnalytics
+from fc.scope_frame import ScopeFrame
+from fc.software_trigger import SoftwareTrigger, TriggerCondition
+from utility.logger import lazyLogger, rootLogger, short_repr
+from utility.metrics import metrics, request_key
 
 
 class ResponseManager(QObject):
     oscill_set_trigger_signal = pyqtSignal(bool)
     oscill_reset_trigger_signal = pyqtSignal(bool)
     oscill_set_trigger_get_data_signal = pyqtSignal(dict, dict, float)
+    # устаревший формат (данные, {"time": ось времени}, start) со списками
+    # значений, отправляется, только если к сигналу кто-то подключён
     oscill_get_data_signal = pyqtSignal(dict, dict, float)
+    oscill_frame_signal = pyqtSignal(object)  # ScopeFrame
+    # потоковая выгрузка (Arguments["ChunkSamples"] в Scope/download):
+    # части приходят по мере получения, в конце - собранная осциллограмма
+    oscill_chunk_signal = pyqtSignal(object)  # ScopeFrame с offset
+    oscill_download_finished_signal = pyqtSignal(object)  # ScopeFrame
+    # сборка прервана (часть потеряна или пришла не по порядку): имя, причина.
+    # Future запроса при этом всё равно завершается значением последней части
+    oscill_download_failed_signal = pyqtSignal(str, str)
+    # результаты ScopeAnalytics по кадру, приходят из потока пула процессов
+    oscill_analytics_signal = pyqtSignal(dict)
+    # окна программного триггера (start_software_trigger), ScopeFrame
+    oscill_triggered_signal = pyqtSignal(object)
+
+    # сборка целой осциллограммы из частей; без неё остаётся только oscill_chunk_signal
+    assemble_chunked_downloads = True
+    # тип запроса -> число потоков его полосы (DispatchLanes); None - все ответы
+    # обрабатываются в потоке manage_answers по очереди
+    dispatch_lanes: Optional[Dict[RequestTypes, int]] = {
+        RequestTypes.SCOPE: 2,
+        RequestTypes.CONNECTION: 1,
+    }
 
     def __init__(self, response_queue: Queue):
         super(QObject, ResponseManager).__init__(self)
@@ -22,56 +56,324 @@ class ResponseManager(QObject):
             target=self.manage_answers, daemon=True
         )
         self.response_queue = response_queue
+        # устройство пула (None - единственное соединение) -> своё кольцо:
+        # номера кадров у каждого производителя свои, общее кольцо их смешало бы
+        self.scope_shared_memories: Dict[Optional[str], ScopeSharedMemory] = dict()
+        self.capture_recorder: Optional[CaptureRecorder] = None
+        self.scope_analytics: Optional[ScopeAnalytics] = None
+        # имя осциллографа -> программный триггер по его кадрам и частям
+        self.software_triggers: Dict[str, SoftwareTrigger] = dict()
+        # имя осциллографа -> (собираемый кадр, номер следующей части)
+        self._chunked_downloads: Dict[str, Tuple[ScopeFrame, int]] = dict()
+        self.lanes: Optional[DispatchLanes] = None
+        if self.dispatch_lanes:
+            self.lanes = DispatchLanes(
+                self._dispatch, self.dispatch_lanes, self._make_lane_queue
+            )
+            metrics.register_gauge("response_lanes", self.lanes.stats)
         self.manage_answer_thread.start()
 
         self.request_type_dict = {
             RequestTypes.SCOPE: self._resolve_scope_request,
+            RequestTypes.CONNECTION: self._resolve_connection_request,
         }
 
+    def enable_scope_shared_memory(
+        self,
+        slots: int = 4,
+        slot_size: int = 16 * 1024 * 1024,
+        device: Optional[str] = None,
+    ) -> dict:
+        """
+        Создание кольца разделяемой памяти для массивов осциллограммы
+
+        :param device: устройство пула ConnectorPool, у каждого своё кольцо
+        :return: параметры, которые нужно передать в Arguments["SharedMemory"]
+            запроса Scope/setup этого устройства
+        """
+        if (scope_shared_memory := self.scope_shared_memories.get(device)) is None:
+            scope_shared_memory = ScopeSharedMemory.create(slots, slot_size)
+            self.scope_shared_memories[device] = scope_shared_memory
+        return scope_shared_memory.arguments()
+
+    def disable_scope_shared_memory(self, device: Optional[str] = None) -> None:
+        """
+        Закрытие и удаление кольца разделяемой памяти устройства
+        """
+        scope_shared_memory = self.scope_shared_memories.pop(device, None)
+        if scope_shared_memory is not None:
+            scope_shared_memory.close()
+            scope_shared_memory.unlink()
+
+    def start_capture_recording(
+        self, path, dtype=np.float32, name: Optional[str] = None
+    ) -> CaptureRecorder:
+        """
+        Запись всех кадров осциллограммы в файл до stop_capture_recording
+        """
+        self.stop_capture_recording()
+        self.capture_recorder = CaptureRecorder(path, dtype, name)
+        return self.capture_recorder
+
+    def stop_capture_recording(self) -> None:
+        if (capture_recorder := self.capture_recorder) is not None:
+            self.capture_recorder = None
+            capture_recorder.close()
+
+    def start_scope_analytics(
+        self, analytics=DEFAULT_METRICS, workers: Optional[int] = None, **kwargs
+    ) -> ScopeAnalytics:
+        """
+        Расчёт метрик каждого кадра осциллограммы в пуле процессов, результаты
+        приходят в oscill_analytics_signal
+
+        :param analytics: имена метрик из scope_analytics.ANALYTICS
+        """
+        self.stop_scope_analytics()
+        self.scope_analytics = ScopeAnalytics(
+            self.oscill_analytics_signal.emit, analytics, workers, **kwargs
+        )
+        return self.scope_analytics
+
+    def stop_scope_analytics(self) -> None:
+        if (scope_analytics := self.scope_analytics) is not None:
+            self.scope_analytics = None
+            scope_analytics.close()
+
+    def start_software_trigger(
+        self,
+        name: str,
+        conditions: Sequence[TriggerCondition],
+        pre_trigger: float,
+        post_trigger: float,
+        **kwargs,
+    ) -> SoftwareTrigger:
+        """
+        Программный триггер по потоку кадров и частей осциллографа name
+        (с префиксом "устройство/" для пула), окна приходят в
+        oscill_triggered_signal
+
+        :param pre_trigger: длительность окна до триггера, с
+        :param post_trigger: длительность окна после триггера, с
+        """
+        software_trigger = SoftwareTrigger(
+            conditions,
+            pre_trigger,
+            post_trigger,
+            self.oscill_triggered_signal.emit,
+            name=name,
+            **kwargs,
+        )
+        self.software_triggers[name] = software_trigger
+        return software_trigger
+
+    def stop_software_trigger(self, name: str) -> None:
+        self.software_triggers.pop(name, None)
+
+    def close(self) -> None:
+        """
+        Освобождение ресурсов при завершении работы: файл записи, пул
+        процессов аналитики, разделяемая память
+        """
+        self.stop_capture_recording()
+        self.stop_scope_analytics()
+        for device in list(self.scope_shared_memories):
+            self.disable_scope_shared_memory(device)
+
     def manage_answers(self):
         while True:
             if prepared_request := self.response_queue.get():
-                rootLogger.trace(f"{prepared_request = }")
+                lazyLogger.trace(
+                    "prepared_request = {}", lambda: short_repr(prepared_request)
+                )
                 _request, _value = prepared_request
-                self._manage_answers(_request, _value)
+                if self.lanes is not None:
+                    self.lanes.dispatch(_request, _value)
+                else:
+                    self._dispatch(_request, _value)
                 self.response_queue.task_done()
 
+    def _dispatch(self, request: dict, answer_value):
+        if metrics.enabled:
+            started = perf_counter()
+            self._manage_answers(request, answer_value)
+            metrics.observe("dispatch", request_key(request), perf_counter() - started)
+        else:
+            self._manage_answers(request, answer_value)
+
+    def _make_lane_queue(self) -> ResponseQueue:
+        lane_queue = ResponseQueue()
+        # у полос те же пределы, что у общей очереди ответов
+        if isinstance(self.response_queue, ResponseQueue):
+            lane_queue.class_limits = dict(self.response_queue.class_limits)
+        return lane_queue
+
+    def lane_depths(self) -> Dict[str, int]:
+        """
+        :return: число ответов, ждущих обработки в каждом потоке полос
+        """
+        return self.lanes.depths() if self.lanes is not None else dict()
+
+    def join(self) -> None:
+        """
+        Ожидание обработки всех полученных ответов
+        """
+        self.response_queue.join()
+        if self.lanes is not None:
+            self.lanes.join()
+
     def _manage_answers(self, request: dict, answer_value: dict):
         request_type, request_method = request["Type"], request["Method"]
         request_name = request["Name"]
-        rootLogger.info(f"Got answer for {request = } with {answer_value = }")
+        # кадры разных устройств пула с одинаковым именем осциллографа не смешиваются
+        if (device := request.get("Device")) is not None:
+            request_name = f"{device}/{request_name}"
+        lazyLogger.debug(
+            "Got answer for request = {} with answer_value = {}",
+            lambda: short_repr(request),
+            lambda: short_repr(answer_value),
+        )
 
         if resolving_command := self.request_type_dict.get(request_type):
             resolving_command(
                 request_method=request_method,
                 request_name=request_name,
                 answer_value=answer_value,
+                device=device,
             )
         else:
             rootLogger.critical(
-                f"Incorrect answer type for {request = } with {answer_value = }"
+                f"Incorrect answer type for request = {short_repr(request)} "
+                f"with answer_value = {short_repr(answer_value)}"
             )
 
     def _resolve_scope_request(
-        self, request_method, request_name: str, answer_value: dict
+        self,
+        request_method,
+        request_name: str,
+        answer_value: dict,
+        device: Optional[str] = None,
     ):
         if request_method == OscMethods.SETUP:
             value = answer_value.get("value")
             if value is not None:
                 self.oscill_set_trigger_signal.emit(value)
         elif request_method in (OscMethods.DOWNLOAD, OscMethods.REQUEST):
-            answer_value_data = answer_value.get("data")
-            answer_start = answer_value.get("start")
-            answer_time = answer_value.get("time")
-            if all(
-                [
-                    answer_value_data is not None,
-                    answer_start is not None,
-                    answer_time is not None,
-                ]
-            ):
-                self.oscill_get_data_signal.emit(
-                    answer_value_data, {"time": answer_time}, answer_start
+            if "SharedMemory" in answer_value:
+                frame = self._read_shared_scope_frame(
+                    request_name, answer_value, device
                 )
+            else:
+                frame = ScopeFrame.from_answer(answer_value, request_name)
+            if "Chunk" in answer_value:
+                self._resolve_scope_chunk(request_name, frame, answer_value["Chunk"])
+            elif frame is not None:
+                self._feed_software_trigger(frame)
+                self._emit_scope_frame(frame)
         elif request_method == OscMethods.RESET:
             self.oscill_reset_trigger_signal.emit(True)
+
+    def _emit_scope_frame(self, frame: ScopeFrame):
+        if (capture_recorder := self.capture_recorder) is not None:
+            capture_recorder.write(frame)
+        if (scope_analytics := self.scope_analytics) is not None:
+            scope_analytics.submit(frame)
+        self.oscill_frame_signal.emit(frame)
+        if self.receivers(self.oscill_get_data_signal):
+            # списки, как и раньше: массивы кадра могут быть общими с другими
+            # подписчиками и переиспользуемыми буферами
+            self.oscill_get_data_signal.emit(
+                {signal: values.tolist() for signal, values in frame.as_dict().items()},
+                {"time": frame.time.tolist()},
+                float(frame.start),
+            )
+
+    def _feed_software_trigger(self, frame: ScopeFrame):
+        # собранная из частей осциллограмма не подаётся: её части уже поданы
+        if (software_trigger := self.software_triggers.get(frame.name)) is not None:
+            software_trigger.feed(frame)
+
+    def _resolve_scope_chunk(
+        self, request_name: str, chunk: Optional[ScopeFrame], chunk_info: dict
+    ):
+        index, count = chunk_info["Index"], chunk_info["Count"]
+        if chunk is None:
+            # часть потеряна: собрать осциллограмму уже не получится
+            if request_name in self._chunked_downloads or index == 0:
+                self._abandon_chunked_download(request_name, f"chunk {index} was lost")
+            return
+        self._feed_software_trigger(chunk)
+        self.oscill_chunk_signal.emit(chunk)
+        if not self.assemble_chunked_downloads:
+            return
+
+        if index == 0:
+            samples = chunk_info["Samples"]
+            frame = ScopeFrame(
+                np.empty((chunk.channels, samples)),
+                np.empty(samples),
+                chunk.signals,
+                chunk.start,
+                name=request_name,
+                trigger=chunk.trigger,
+            )
+        elif request_name in self._chunked_downloads:
+            frame, expected_index = self._chunked_downloads[request_name]
+            if index != expected_index:
+                self._abandon_chunked_download(
+                    request_name, f"got chunk {index} instead of {expected_index}"
+                )
+                return
+        else:
+            return
+
+        end = chunk.offset + chunk.samples
+        frame.data[:, chunk.offset : end] = chunk.data
+        frame.time[chunk.offset : end] = chunk.time
+        if index == count - 1:
+            self._chunked_downloads.pop(request_name, None)
+            self.oscill_download_finished_signal.emit(frame)
+            self._emit_scope_frame(frame)
+        else:
+            self._chunked_downloads[request_name] = (frame, index + 1)
+
+    def _abandon_chunked_download(self, request_name: str, reason: str):
+        self._chunked_downloads.pop(request_name, None)
+        rootLogger.critical(f"Chunked download of {request_name} failed: {reason}")
+        self.oscill_download_failed_signal.emit(request_name, reason)
+
+    def _resolve_connection_request(
+        self,
+        request_method,
+        request_name: str,
+        answer_value: dict,
+        device: Optional[str] = None,
+    ):
+        # служебные запросы канала (согласование, ping) сигналов не порождают
+        pass
+
+    def _read_shared_scope_frame(
+        self, request_name: str, answer_value: dict, device: Optional[str] = None
+    ) -> Optional[ScopeFrame]:
+        descriptor = answer_value["SharedMemory"]
+        scope_shared_memory = self.scope_shared_memories.get(device)
+        if scope_shared_memory is None or scope_shared_memory.name != descriptor.get(
+            "Name"
+        ):
+            rootLogger.critical(f"Unknown shared memory in scope answer {descriptor = }")
+            return None
+        if (frame := scope_shared_memory.read_frame(descriptor)) is None:
+            return None
+        data, time = frame
+        if (start := answer_value.get("start")) is None:
+            # start - время первой точки, ось времени есть в разделяемой памяти
+            start = float(time[0]) if time.size else 0.0
+        return ScopeFrame(
+            data,
+            time,
+            descriptor["Signals"],
+            start,
+            name=request_name,
+            trigger=answer_value.get("trigger"),
+            offset=answer_value.get("Chunk", dict()).get("Offset", 0),
+        )
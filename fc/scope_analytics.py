@@ -0,0 +1,315 @@
+import os
+import threading
+from concurrent.futures import Future, ProcessPoolExecutor
+from functools import partial
+from multiprocessing import resource_tracker, shared_memory
+from typing import Callable, Dict, List, Optional, Sequence
+
+import numpy as np
+
+from fc.scope_frame import ScopeFrame
+from utility.logger import rootLogger
+
+DEFAULT_METRICS = ("min", "max", "mean", "rms", "peak_to_peak", "thd", "trigger")
+# сколько гармоник учитывается в THD, включая основную
+THD_HARMONICS = 10
+# окно Ханна из 1-2 точек нулевое: спектр по такому кадру не считается
+MIN_SPECTRUM_SAMPLES = 3
+
+
+def _sample_rate(time: np.ndarray) -> float:
+    if time.size < 2 or time[-1] == time[0]:
+        return 0.0
+    return float((time.size - 1) / (time[-1] - time[0]))
+
+
+class _FrameContext:
+    """
+    Кадр в процессе-обработчике: строки сигналов поверх разделяемой памяти и
+    спектр, который считается один раз для всех метрик, которым он нужен
+    """
+
+    def __init__(self, data: np.ndarray, time: np.ndarray, trigger_index: int):
+        self.data = data
+        self.time = time
+        self.trigger_index = trigger_index
+        self.sample_rate = _sample_rate(time)
+        self._amplitude: Optional[np.ndarray] = None
+
+    @property
+    def amplitude(self) -> np.ndarray:
+        """
+        Амплитудный спектр с окном Ханна, сигнал за сигналом
+        """
+        if self._amplitude is None:
+            samples = self.data.shape[1]
+            window = np.hanning(samples)
+            spectrum = np.fft.rfft(
+                (self.data - self.data.mean(axis=1, keepdims=True)) * window, axis=1
+            )
+            self._amplitude = np.abs(spectrum) * (2.0 / window.sum())
+        return self._amplitude
+
+
+def _thd(context: _FrameContext) -> dict:
+    if context.data.shape[1] < MIN_SPECTRUM_SAMPLES:
+        undefined = np.full(context.data.shape[0], np.nan)
+        return {
+            "thd": undefined,
+            "fundamental": undefined,
+            "fundamental_amplitude": undefined,
+        }
+    amplitude = context.amplitude
+    channels, bins = amplitude.shape
+    rows = np.arange(channels)
+    # основная гармоника - наибольшая составляющая без постоянной
+    fundamental_bin = np.argmax(amplitude[:, 1:], axis=1) + 1
+    harmonics = np.arange(1, THD_HARMONICS + 1)
+    harmonic_bins = fundamental_bin[:, None] * harmonics[None, :]
+    valid = harmonic_bins < bins - 1
+    harmonic_bins = np.minimum(harmonic_bins, bins - 2)
+    # окно Ханна размазывает гармонику на соседние отсчёты: берём максимум из трёх
+    levels = np.max(
+        [amplitude[rows[:, None], harmonic_bins + shift] for shift in (-1, 0, 1)],
+        axis=0,
+    )
+    levels = np.where(valid, levels, 0.0)
+    fundamental = levels[:, 0]
+    distortion = np.sqrt(np.sum(levels[:, 1:] ** 2, axis=1))
+    with np.errstate(divide="ignore", invalid="ignore"):
+        thd = np.where(fundamental > 0, distortion / fundamental, np.nan)
+    bin_width = context.sample_rate / context.data.shape[1]
+    return {
+        "thd": thd,
+        "fundamental": fundamental_bin * bin_width,
+        "fundamental_amplitude": fundamental,
+    }
+
+
+def _spectrum(context: _FrameContext) -> dict:
+    channels, samples = context.data.shape
+    if samples < MIN_SPECTRUM_SAMPLES:
+        bins = samples // 2 + 1
+        return {
+            "frequency": np.full(bins, np.nan),
+            "amplitude": np.full((channels, bins), np.nan, dtype=np.float32),
+        }
+    return {
+        "frequency": np.fft.rfftfreq(samples, 1.0 / context.sample_rate)
+        if context.sample_rate
+        else np.zeros(samples // 2 + 1),
+        "amplitude": context.amplitude.astype(np.float32),
+    }
+
+
+def _trigger(context: _FrameContext) -> dict:
+    index = context.trigger_index
+    if not 0 <= index < context.data.shape[1]:
+        return {"trigger_values": None}
+    # размах вокруг триггера: 1 % кадра в каждую сторону
+    around = context.data.shape[1] // 100
+    return {
+        "trigger_values": context.data[:, index].copy(),
+        "trigger_swing": np.ptp(
+            context.data[:, max(0, index - around) : index + around + 1], axis=1
+        ),
+    }
+
+
+# имя метрики -> функция от _FrameContext, возвращающая словарь результатов;
+# значения по сигналам - массивы длиной в число сигналов кадра
+ANALYTICS: Dict[str, Callable[[_FrameContext], dict]] = {
+    "min": lambda context: {"min": context.data.min(axis=1)},
+    "max": lambda context: {"max": context.data.max(axis=1)},
+    "mean": lambda context: {"mean": context.data.mean(axis=1)},
+    "std": lambda context: {"std": context.data.std(axis=1)},
+    "rms": lambda context: {
+        "rms": np.sqrt(
+            np.einsum("ij,ij->i", context.data, context.data) / context.data.shape[1]
+        )
+    },
+    "peak_to_peak": lambda context: {"peak_to_peak": np.ptp(context.data, axis=1)},
+    "thd": _thd,
+    "spectrum": _spectrum,
+    "trigger": _trigger,
+}
+
+# процесс-обработчик: номер слота -> подключённый сегмент. resource_tracker у
+# процессов пула общий с главным процессом, поэтому сегменты удалит он
+_attached: Dict[int, shared_memory.SharedMemory] = dict()
+
+
+def _attach(slot: int, memory_name: str) -> shared_memory.SharedMemory:
+    memory = _attached.get(slot)
+    if memory is not None and memory.name != memory_name:
+        # слот вырос: прежний сегмент уже удалён, отображение надо освободить
+        memory.close()
+        memory = None
+    if memory is None:
+        memory = _attached[slot] = shared_memory.SharedMemory(name=memory_name)
+    return memory
+
+
+def _analyze(
+    slot: int,
+    memory_name: str,
+    channels: int,
+    samples: int,
+    metrics: Sequence[str],
+    trigger_index: int,
+) -> dict:
+    memory = _attach(slot, memory_name)
+    frame = np.ndarray((channels + 1, samples), dtype="<f8", buffer=memory.buf)
+    context = _FrameContext(frame[1:], frame[0], trigger_index)
+    results = dict()
+    errors = dict()
+    for name in metrics:
+        # ошибка одной метрики не должна лишать кадр остальных
+        try:
+            results.update(ANALYTICS[name](context))
+        except Exception as exc:
+            errors[name] = repr(exc)
+    if errors:
+        results["Errors"] = errors
+    # результаты не должны ссылаться на разделяемую память
+    return {
+        key: value.copy() if isinstance(value, np.ndarray) else value
+        for key, value in results.items()
+    }
+
+
+class ScopeAnalytics:
+    """
+    Расчёт метрик кадров осциллограммы (RMS, THD, спектр, min/max/mean,
+    значения в момент триггера) в пуле процессов, чтобы не нагружать процесс GUI
+
+    Кадр копируется в свободный слот разделяемой памяти (ось времени и сигналы
+    одной матрицей float64), процессу передаётся только имя слота и размеры.
+    Слот занят, пока кадр обрабатывается; если свободных слотов нет, кадр
+    пропускается (dropped_frames) - разбор не отстаёт от потока кадров.
+    Кадры разных осциллографов и подряд идущие кадры считаются параллельно на
+    разных ядрах, результаты передаются в callback из служебного потока пула
+    """
+
+    def __init__(
+        self,
+        callback: Callable[[dict], None],
+        metrics: Sequence[str] = DEFAULT_METRICS,
+        workers: Optional[int] = None,
+        slots: Optional[int] = None,
+        slot_size: int = 4 * 1024 * 1024,
+        mp_context=None,
+    ):
+        """
+        :param callback: получает словарь с "Name", "Signals", "Start",
+            "Samples", "SampleRate", "Trigger" и результатами метрик;
+            в "Errors" - ошибки метрик, которые посчитать не удалось
+        :param metrics: имена из ANALYTICS
+        :param workers: число процессов, по умолчанию - все ядра, кроме одного
+        :param slots: наибольшее число кадров в обработке, по умолчанию 2 на процесс
+        :param slot_size: начальный размер слота; слот растёт под большие кадры
+        :param mp_context: контекст multiprocessing пула. При spawn и forkserver
+            главный модуль приложения импортируется в процессах пула заново
+        """
+        if unknown := [name for name in metrics if name not in ANALYTICS]:
+            raise ValueError(f"Unknown scope analytics {unknown}")
+        self.callback = callback
+        self.metrics = tuple(metrics)
+        self.workers = workers or max(1, (os.cpu_count() or 2) - 1)
+        self.processed_frames = 0
+        self.dropped_frames = 0
+        self._lock = threading.Lock()
+        # общий с процессами пула resource_tracker (см. _attached)
+        resource_tracker.ensure_running()
+        self._executor: Optional[ProcessPoolExecutor] = ProcessPoolExecutor(
+            self.workers, mp_context=mp_context
+        )
+        # процессы пула запускаются до создания слотов: при fork они иначе
+        # унаследовали бы отображения слотов, которые не смогут освободить
+        self._executor.submit(os.getpid).result()
+        self._slots: List[shared_memory.SharedMemory] = [
+            shared_memory.SharedMemory(create=True, size=slot_size)
+            for _ in range(slots or 2 * self.workers)
+        ]
+        self._free_slots = list(range(len(self._slots)))
+
+    @property
+    def in_flight(self) -> int:
+        with self._lock:
+            return len(self._slots) - len(self._free_slots)
+
+    def submit(self, frame: ScopeFrame) -> bool:
+        """
+        :return: False, если кадр пропущен
+        """
+        with self._lock:
+            if self._executor is None or not self._free_slots:
+                self.dropped_frames += 1
+                return False
+            slot = self._free_slots.pop()
+        channels, samples = frame.channels, frame.samples
+        size = (channels + 1) * samples * 8
+        memory = self._slots[slot]
+        if memory.size < size:
+            memory.close()
+            memory.unlink()
+            memory = self._slots[slot] = shared_memory.SharedMemory(
+                create=True, size=size
+            )
+        view = np.ndarray((channels + 1, samples), dtype="<f8", buffer=memory.buf)
+        view[0] = frame.time
+        view[1:] = frame.data
+        del view
+        trigger_index = frame.trigger.get("Index")
+        try:
+            future = self._executor.submit(
+                _analyze,
+                slot,
+                memory.name,
+                channels,
+                samples,
+                self.metrics,
+                -1 if trigger_index is None else int(trigger_index),
+            )
+        except RuntimeError:
+            # пул уже остановлен
+            self._release(slot)
+            return False
+        description = {
+            "Name": frame.name,
+            "Signals": frame.signals,
+            "Start": frame.start,
+            "Samples": samples,
+            "SampleRate": _sample_rate(frame.time),
+            "Trigger": frame.trigger,
+        }
+        future.add_done_callback(partial(self._finished, slot, description))
+        return True
+
+    def _finished(self, slot: int, description: dict, future: Future) -> None:
+        self._release(slot)
+        if future.cancelled():
+            return
+        if (exc := future.exception()) is not None:
+            rootLogger.error(f"Scope analytics failed for {description['Name']}: {exc}")
+            return
+        self.processed_frames += 1
+        if errors := future.result().get("Errors"):
+            rootLogger.error(
+                f"Scope analytics failed for {description['Name']}: {errors}"
+            )
+        self.callback({**description, **future.result()})
+
+    def _release(self, slot: int) -> None:
+        with self._lock:
+            self._free_slots.append(slot)
+
+    def close(self) -> None:
+        with self._lock:
+            executor, self._executor = self._executor, None
+        if executor is None:
+            return
+        executor.shutdown(wait=True, cancel_futures=True)
+        for memory in self._slots:
+            memory.close()
+            memory.unlink()
@@ -0,0 +1,107 @@
+from typing import Dict, Iterable, Mapping, Optional, Sequence
+
+import numpy as np
+
+from utility.logger import rootLogger
+
+
+class ScopeFrame:
+    """
+    Кадр осциллограммы
+
+    Данные хранятся одной непрерывной матрицей float64 размером
+    число сигналов x число точек, строки которой адресуются по имени сигнала.
+    Кадр собирается один раз при разборе ответа, дальше его срезы отдаются
+    без копирования. Часть потоковой выгрузки - тоже кадр, offset у неё равен
+    номеру первой точки внутри всей осциллограммы
+    """
+
+    __slots__ = (
+        "name",
+        "data",
+        "time",
+        "signals",
+        "index",
+        "start",
+        "trigger",
+        "offset",
+    )
+
+    def __init__(
+        self,
+        data: np.ndarray,
+        time: np.ndarray,
+        signals: Sequence[str],
+        start: float,
+        name: str = "",
+        trigger: Optional[dict] = None,
+        offset: int = 0,
+    ):
+        self.name = name
+        self.data = data
+        self.time = time
+        self.signals = tuple(signals)
+        self.index: Dict[str, int] = {
+            signal: row for row, signal in enumerate(self.signals)
+        }
+        self.start = start
+        self.trigger = trigger or dict()
+        self.offset = offset
+
+    @classmethod
+    def from_answer(
+        cls, answer_value: dict, name: str = ""
+    ) -> Optional["ScopeFrame"]:
+        """
+        Сборка кадра из ответа Scope/request или Scope/download
+        """
+        answer_data: Optional[Mapping[str, Iterable[float]]] = answer_value.get("data")
+        answer_time = answer_value.get("time")
+        answer_start = answer_value.get("start")
+        if answer_data is None or answer_time is None or answer_start is None:
+            return None
+        time = np.asarray(answer_time, dtype=np.float64)
+        data = np.empty((len(answer_data), time.size), dtype=np.float64)
+        for row, (signal, values) in enumerate(answer_data.items()):
+            values = np.asarray(values, dtype=np.float64)
+            if values.size != time.size:
+                rootLogger.critical(
+                    f"Signal {signal} has {values.size} samples instead of {time.size}"
+                )
+                return None
+            data[row] = values
+        return cls(
+            data,
+            time,
+            list(answer_data),
+            answer_start,
+            name=name,
+            trigger=answer_value.get("trigger"),
+            offset=answer_value.get("Chunk", dict()).get("Offset", 0),
+        )
+
+    @property
+    def channels(self) -> int:
+        return self.data.shape[0]
+
+    @property
+    def samples(self) -> int:
+        return self.data.shape[1]
+
+    def __len__(self) -> int:
+        return self.samples
+
+    def __contains__(self, signal: str) -> bool:
+        return signal in self.index
+
+    def __getitem__(self, signal: str) -> np.ndarray:
+        return self.data[self.index[signal]]
+
+    def as_dict(self) -> Dict[str, np.ndarray]:
+        return dict(zip(self.signals, self.data))
+
+    def __repr__(self) -> str:
+        return (
+            f"ScopeFrame(name={self.name!r}, signals={self.signals}, "
+            f"samples={self.samples}, start={self.start})"
+        )
@@ -0,0 +1,400 @@
+from typing import Callable, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+from fc.scope_frame import ScopeFrame
+from utility.logger import rootLogger
+
+RISING = "rising"
+FALLING = "falling"
+
+
+class TriggerCondition:
+    """
+    Условие программного триггера по одному сигналу
+
+    edge и slope дают события (переход условия из ложного в истинное),
+    level и window - состояния, при которых события разрешены
+    """
+
+    __slots__ = ("kind", "signal", "low", "high", "direction", "hysteresis", "_state")
+
+    EVENTS = ("edge", "slope")
+
+    def __init__(
+        self,
+        kind: str,
+        signal: str,
+        low: float,
+        high: float = 0.0,
+        direction: str = RISING,
+        hysteresis: float = 0.0,
+    ):
+        self.kind = kind
+        self.signal = signal
+        self.low = low
+        self.high = high
+        self.direction = direction
+        self.hysteresis = hysteresis
+        # значение условия на последней точке предыдущей части
+        self._state: Optional[bool] = None
+
+    @classmethod
+    def edge(
+        cls, signal: str, level: float, direction: str = RISING, hysteresis: float = 0.0
+    ) -> "TriggerCondition":
+        """
+        Пересечение уровня. С гистерезисом фронт засчитывается, только если
+        сигнал перед этим ушёл за level на hysteresis в обратную сторону
+        """
+        return cls("edge", signal, level, direction=direction, hysteresis=hysteresis)
+
+    @classmethod
+    def level(
+        cls, signal: str, level: float, direction: str = RISING
+    ) -> "TriggerCondition":
+        """
+        Сигнал выше уровня (RISING) или ниже (FALLING)
+        """
+        return cls("level", signal, level, direction=direction)
+
+    @classmethod
+    def window(
+        cls, signal: str, low: float, high: float, inside: bool = False
+    ) -> "TriggerCondition":
+        """
+        Сигнал вне окна [low, high] или, при inside=True, внутри него
+        """
+        return cls("window", signal, low, high, direction=RISING if inside else FALLING)
+
+    @classmethod
+    def slope(
+        cls, signal: str, rate: float, direction: str = RISING
+    ) -> "TriggerCondition":
+        """
+        Скорость изменения не меньше rate в единицах сигнала в секунду
+        (для FALLING - спад не медленнее rate)
+        """
+        return cls("slope", signal, abs(rate), direction=direction)
+
+    @property
+    def is_event(self) -> bool:
+        return self.kind in self.EVENTS
+
+    def reset(self) -> None:
+        self._state = None
+
+    def evaluate(self, extended: np.ndarray, sample_rate: float) -> np.ndarray:
+        """
+        :param extended: последняя точка предыдущей части и точки новой части
+        :return: значения условия на точках новой части и перед ними
+            (длина на 1 больше числа новых точек)
+        """
+        values = extended[1:]
+        if self.kind == "slope":
+            change = np.diff(extended) * sample_rate
+            if self.direction == RISING:
+                state = change >= self.low
+            else:
+                state = change <= -self.low
+        elif self.kind == "window":
+            inside = (values >= self.low) & (values <= self.high)
+            state = inside if self.direction == RISING else ~inside
+        elif self.kind == "edge" and self.hysteresis > 0:
+            state = self._hysteresis_state(values)
+        elif self.direction == RISING:
+            state = values >= self.low
+        else:
+            state = values < self.low
+        previous = self._state
+        if previous is None:
+            # первая часть потока: до неё условие считается неизменным
+            previous = bool(state[0]) if state.size else False
+        if state.size:
+            self._state = bool(state[-1])
+        return np.concatenate(([previous], state))
+
+    def _hysteresis_state(self, values: np.ndarray) -> np.ndarray:
+        if self.direction == RISING:
+            fire, arm = values >= self.low, values < self.low - self.hysteresis
+        else:
+            fire, arm = values < self.low, values >= self.low + self.hysteresis
+        # состояние - последнее из событий "взвести"/"сработать" на точке и до неё
+        marked = np.where(fire | arm, np.arange(values.size), -1)
+        np.maximum.accumulate(marked, out=marked)
+        state = fire[np.maximum(marked, 0)]
+        if self._state is not None:
+            state[marked < 0] = self._state
+        return state
+
+
+class RingBuffer:
+    """
+    Кольцевой буфер точек потока: строка оси времени и строки сигналов
+    адресуются абсолютным номером точки от начала потока
+    """
+
+    def __init__(self, channels: int, capacity: int):
+        self.buffer = np.empty((channels + 1, capacity))
+        self.written = 0
+
+    @property
+    def capacity(self) -> int:
+        return self.buffer.shape[1]
+
+    @property
+    def first(self) -> int:
+        """
+        Номер самой старой точки, ещё хранящейся в буфере
+        """
+        return max(0, self.written - self.capacity)
+
+    def append(self, time: np.ndarray, data: np.ndarray) -> None:
+        samples = time.size
+        if samples > self.capacity:
+            time, data = time[-self.capacity :], data[:, -self.capacity :]
+            self.written += samples - self.capacity
+            samples = self.capacity
+        start = self.written % self.capacity
+        head = min(samples, self.capacity - start)
+        self.buffer[0, start : start + head] = time[:head]
+        self.buffer[1:, start : start + head] = data[:, :head]
+        if head < samples:
+            self.buffer[0, : samples - head] = time[head:]
+            self.buffer[1:, : samples - head] = data[:, head:]
+        self.written += samples
+
+    def grow(self, capacity: int) -> None:
+        if capacity <= self.capacity:
+            return
+        first = self.first
+        kept = self.extract(first, self.written)
+        self.buffer = np.empty((self.buffer.shape[0], capacity))
+        self.written = first
+        self.append(kept[0], kept[1:])
+
+    def extract(self, start: int, stop: int) -> np.ndarray:
+        """
+        Копия точек [start, stop), которые ещё хранятся в буфере
+        """
+        start = max(start, self.first)
+        samples = max(0, stop - start)
+        first = start % self.capacity
+        head = min(samples, self.capacity - first)
+        return np.concatenate(
+            (
+                self.buffer[:, first : first + head],
+                self.buffer[:, : samples - head],
+            ),
+            axis=1,
+        )
+
+
+class SoftwareTrigger:
+    """
+    Программный триггер по непрерывному потоку частей осциллограммы
+
+    Условия вычисляются векторно по каждой части целиком, последняя точка
+    предыдущей части переносится, поэтому фронт на стыке частей не теряется.
+    Срабатывание - событие любого из условий edge/slope в точке, где выполнены
+    все условия level/window (combine="all") или хотя бы одно (combine="any").
+    Без событийных условий срабатывание - переход состояний в истинное.
+    Окно [триггер - pre, триггер + post) вырезается из кольцевого буфера,
+    когда придёт последняя его точка, и передаётся в callback кадром
+    ScopeFrame, у которого trigger["Index"] - номер точки триггера в окне
+
+    Если очередная часть не продолжает поток по времени (новая запись,
+    другой набор сигналов), поток начинается заново
+    """
+
+    def __init__(
+        self,
+        conditions: Sequence[TriggerCondition],
+        pre_trigger: float,
+        post_trigger: float,
+        callback: Callable[[ScopeFrame], None],
+        combine: str = "all",
+        holdoff: Optional[float] = None,
+        name: str = "",
+    ):
+        """
+        :param pre_trigger: длительность окна до триггера, с
+        :param post_trigger: длительность окна после триггера, с
+        :param holdoff: наименьший интервал между срабатываниями, с;
+            по умолчанию post_trigger, чтобы окна не перекрывались
+        :param name: имя кадров-окон
+        """
+        if not conditions:
+            raise ValueError("Software trigger needs at least one condition")
+        if combine not in ("all", "any"):
+            raise ValueError(f"Unknown combine mode {combine!r}")
+        self.conditions = list(conditions)
+        self.pre_trigger = pre_trigger
+        self.post_trigger = post_trigger
+        self.holdoff = post_trigger if holdoff is None else holdoff
+        self.callback = callback
+        self.combine = combine
+        self.name = name
+        self.triggers = 0
+        self._signals: Optional[Tuple[str, ...]] = None
+        self._rows: List[int] = []
+        self._ring: Optional[RingBuffer] = None
+        self._sample_rate = 0.0
+        # длительности в точках, считаются по частоте дискретизации потока
+        self._pre = self._post = self._holdoff = 0
+        self._last_time: Optional[float] = None
+        self._last_samples: Optional[np.ndarray] = None
+        self._next_allowed = 0
+        # абсолютные номера точек триггера, окна которых ещё не закончились
+        self._pending: List[int] = []
+        # часть из одной точки в начале потока: частота дискретизации
+        # станет известна со следующей частью
+        self._held: Optional[ScopeFrame] = None
+
+    def reset(self) -> None:
+        self._signals = None
+        self._ring = None
+        self._sample_rate = 0.0
+        self._last_time = None
+        self._last_samples = None
+        self._pending = []
+        self._held = None
+        for condition in self.conditions:
+            condition.reset()
+
+    def feed(self, chunk: ScopeFrame) -> int:
+        """
+        :return: число срабатываний в этой части
+        """
+        if chunk.samples == 0:
+            return 0
+        if self._held is not None:
+            chunk = self._join_held(chunk)
+        if not self._continues(chunk):
+            self._start(chunk)
+        if self._ring is None:
+            return 0
+        position = self._ring.written
+        data = chunk.data[self._rows]
+        extended = np.concatenate((self._last_samples[:, None], data), axis=1)
+        self._ring.grow(self._pre + self._post + chunk.samples)
+        self._ring.append(chunk.time, chunk.data)
+        self._last_samples = data[:, -1].copy()
+        self._last_time = float(chunk.time[-1])
+
+        found = self._find(extended)
+        for index in found:
+            self._pending.append(position + int(index))
+        self.triggers += len(found)
+        self._cut_ready()
+        return len(found)
+
+    def _continues(self, chunk: ScopeFrame) -> bool:
+        if self._last_time is None or chunk.signals != self._signals:
+            return False
+        if chunk.samples > 1:
+            step = (chunk.time[-1] - chunk.time[0]) / (chunk.samples - 1)
+        else:
+            step = 1.0 / self._sample_rate if self._sample_rate else 0.0
+        return step > 0 and abs(chunk.time[0] - self._last_time - step) <= 0.5 * step
+
+    def _join_held(self, chunk: ScopeFrame) -> ScopeFrame:
+        held, self._held = self._held, None
+        if chunk.signals != held.signals or chunk.time[0] <= held.time[-1]:
+            return chunk
+        return ScopeFrame(
+            np.concatenate((held.data, chunk.data), axis=1),
+            np.concatenate((held.time, chunk.time)),
+            chunk.signals,
+            held.start,
+            name=chunk.name,
+            trigger=chunk.trigger,
+        )
+
+    def _start(self, chunk: ScopeFrame) -> None:
+        if self._pending:
+            rootLogger.warning(
+                f"Scope stream {self.name!r} restarted, "
+                f"{len(self._pending)} trigger windows were not completed"
+            )
+        self.reset()
+        try:
+            self._rows = [
+                chunk.index[condition.signal] for condition in self.conditions
+            ]
+        except KeyError as exc:
+            rootLogger.error(f"Software trigger signal {exc} is not in the scope frame")
+            return
+        self._signals = chunk.signals
+        if chunk.samples < 2:
+            self._held = chunk
+            return
+        if chunk.time[-1] != chunk.time[0]:
+            self._sample_rate = (chunk.samples - 1) / (chunk.time[-1] - chunk.time[0])
+        if not self._sample_rate:
+            return
+        self._pre = int(round(self.pre_trigger * self._sample_rate))
+        self._post = max(1, int(round(self.post_trigger * self._sample_rate)))
+        self._holdoff = max(1, int(round(self.holdoff * self._sample_rate)))
+        self._ring = RingBuffer(chunk.channels, self._pre + self._post + chunk.samples)
+        self._next_allowed = 0
+        # до первой точки сигнал считается неизменным
+        self._last_samples = chunk.data[self._rows, 0].copy()
+
+    def _find(self, extended: np.ndarray) -> np.ndarray:
+        """
+        :return: номера точек срабатывания внутри новой части
+        """
+        events = []
+        states = []
+        for row, condition in enumerate(self.conditions):
+            state = condition.evaluate(extended[row], self._sample_rate)
+            if condition.is_event:
+                events.append(state[1:] & ~state[:-1])
+            else:
+                states.append(state)
+        if self.combine == "all":
+            reduce = np.logical_and.reduce
+        else:
+            reduce = np.logical_or.reduce
+        if events:
+            fired = np.logical_or.reduce(events)
+            if states:
+                fired &= reduce(states)[1:]
+        else:
+            qualified = reduce(states)
+            fired = qualified[1:] & ~qualified[:-1]
+        candidates = np.flatnonzero(fired)
+        if not candidates.size:
+            return candidates
+        # holdoff: после срабатывания следующие holdoff точек пропускаются
+        offset = self._ring.written - extended.shape[1] + 1
+        accepted = []
+        index = int(np.searchsorted(candidates, self._next_allowed - offset))
+        while index < candidates.size:
+            accepted.append(candidates[index])
+            self._next_allowed = offset + int(candidates[index]) + self._holdoff
+            index = int(
+                np.searchsorted(candidates, self._next_allowed - offset, side="left")
+            )
+        return np.array(accepted, dtype=np.int64)
+
+    def _cut_ready(self) -> None:
+        written = self._ring.written
+        while self._pending and self._pending[0] + self._post <= written:
+            trigger = self._pending.pop(0)
+            window = self._ring.extract(trigger - self._pre, trigger + self._post)
+            # у начала потока окно до триггера может быть короче pre
+            trigger_index = window.shape[1] - self._post
+            frame = ScopeFrame(
+                window[1:],
+                window[0],
+                self._signals,
+                float(window[0, 0]),
+                name=self.name,
+                trigger={
+                    "Index": trigger_index,
+                    "Time": float(window[0, trigger_index]),
+                },
+            )
+            self.callback(frame)
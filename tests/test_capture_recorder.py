@@ -0,0 +1,21 @@
+import numpy as np
+
+from fc.capture_recorder import CaptureReader, CaptureRecorder
+from fc.scope_frame import ScopeFrame
+
+
+def _frame(signals=("Ia",)) -> ScopeFrame:
+    time = np.arange(4) / 1000.0
+    return ScopeFrame(np.ones((len(signals), 4)), time, list(signals), 0.0, name="osc")
+
+
+def test_write_after_close_does_not_open_a_new_file(tmp_path):
+    recorder = CaptureRecorder(tmp_path / "capture.fccap")
+    recorder.write(_frame())
+    recorder.close()
+    # поток полосы успел взять ссылку на запись до остановки
+    recorder.write(_frame(("Ia", "Ub")))
+
+    assert recorder.paths == [tmp_path / "capture.fccap"]
+    assert sorted(path.name for path in tmp_path.iterdir()) == ["capture.fccap"]
+    assert len(CaptureReader(tmp_path / "capture.fccap")) == 1
@@ -0,0 +1,50 @@
+import json
+
+import pytest
+
+from communicator.connector_pool import DeviceRoutingQueue
+from communicator.locked_queue import LockedPriorityQueue
+from fc.fc_controls import FC_Controls
+from fc.packet_type import ConnectionMethods, RequestTypes
+
+
+def test_unknown_device_fails_the_future():
+    request_queue = DeviceRoutingQueue()
+    request_queue.add_device("left", LockedPriorityQueue())
+    request_queue.unlock()
+    fc_controls = FC_Controls()
+    fc_controls.set_request_queue(request_queue)
+
+    future = fc_controls.make_request(
+        FC_Controls.make_command(
+            RequestTypes.CONNECTION, "", ConnectionMethods.PING, device="right"
+        )
+    )
+    with pytest.raises(ValueError):
+        future.result(timeout=0)
+    assert request_queue.qsize() == 0
+
+
+def test_device_is_not_sent_to_the_connector():
+    device_queue = LockedPriorityQueue()
+    device_queue.coalesce_duplicates = False
+    request_queue = DeviceRoutingQueue()
+    request_queue.add_device("left", device_queue)
+    request_queue.unlock()
+    fc_controls = FC_Controls()
+    fc_controls.set_request_queue(request_queue)
+
+    fc_controls.make_request(
+        FC_Controls.make_command(
+            RequestTypes.CONNECTION, "", ConnectionMethods.PING, device="left"
+        )
+    )
+    template = FC_Controls.command_template(
+        RequestTypes.CONNECTION, "", ConnectionMethods.PING, device="left"
+    )
+    fc_controls.make_template_request(template)
+
+    for _ in range(2):
+        queued_request = device_queue.get_nowait()
+        assert queued_request.request["Device"] == "left"
+        assert "Device" not in json.loads(queued_request.payload)
@@ -0,0 +1,39 @@
+import io
+
+import pytest
+
+from communicator.binary_codec import pack, unpack
+from communicator.framing import BinaryFraming, TextFraming
+from communicator.pending_requests import QueuedRequest
+from utility.json_encoder import command_encoder
+
+
+def _decoded(framing, queued_request: QueuedRequest) -> dict:
+    return framing.feed(framing.encode_request(queued_request))[0]
+
+
+def test_binary_and_text_framing_send_the_same_decorated_request():
+    request = {"Id": 1, "Type": "Scope", "Name": "osc", "Method": "setup"}
+    request["Arguments"] = {"Level": float("inf"), "Window": {"Low": float("-inf")}}
+    queued_request = QueuedRequest(request, command_encoder.encode(request))
+
+    text, binary = _decoded(TextFraming(), queued_request), _decoded(
+        BinaryFraming(), queued_request
+    )
+    assert binary == text
+    assert binary["Arguments"] == {"Level": "inf", "Window": {"Low": "-inf"}}
+
+
+@pytest.mark.parametrize("cut", [1, 30, 52])
+def test_truncated_binary_message_is_rejected(cut):
+    data = pack({"a": "x" * 50})
+    with pytest.raises(ValueError):
+        unpack(data[:-cut])
+
+
+def test_truncated_binary_record_reads_as_end_of_stream():
+    framing = BinaryFraming()
+    data = framing.encode({"a": 1}) + framing.encode({"b": "x" * 50})
+    stream = io.BytesIO(data[:-10])
+    assert framing.decode(framing.read_message(stream)) == {"a": 1}
+    assert framing.read_message(stream) == b""
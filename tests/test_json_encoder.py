@@ -0,0 +1,36 @@
+import json
+
+import numpy as np
+import pytest
+
+from utility.json_encoder import CommandEncoder
+
+BACKENDS = CommandEncoder().available_backends
+
+
+@pytest.fixture(params=BACKENDS)
+def encoder(request) -> CommandEncoder:
+    encoder = CommandEncoder()
+    encoder.set_backend(request.param)
+    return encoder
+
+
+def test_none_next_to_numpy_array(encoder):
+    value = {"Arguments": {"x": None, "arr": np.array([1.0, 2.0])}}
+    assert json.loads(encoder.encode(value)) == {
+        "Arguments": {"x": None, "arr": [1.0, 2.0]}
+    }
+
+
+def test_infinities_are_decorated(encoder):
+    value = {"Arguments": {"Level": float("inf"), "x": None}}
+    assert json.loads(encoder.encode(value)) == {
+        "Arguments": {"Level": "inf", "x": None}
+    }
+
+
+def test_non_finite_values_in_arrays_are_kept(encoder):
+    value = {"Arguments": {"arr": np.array([1.0, np.nan]), "x": None}}
+    encoded = json.loads(encoder.encode(value))
+    assert encoded["Arguments"]["x"] is None
+    assert np.isnan(encoded["Arguments"]["arr"][1])
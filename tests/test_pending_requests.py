@@ -0,0 +1,42 @@
+from communicator.locked_queue import LockedPriorityQueue
+from communicator.pending_requests import QueuedRequest
+
+
+def _queued(request_id: int) -> QueuedRequest:
+    request = {"Id": request_id, "Type": "Connection", "Name": "", "Method": "ping"}
+    return QueuedRequest(request, "", idempotent=True)
+
+
+def test_replayed_request_coalesced_with_waiting_duplicate():
+    queue = LockedPriorityQueue()
+    queue.unlock()
+    replayed, replayed_waiter, waiting = _queued(1), _queued(2), _queued(3)
+    # до разрыва связи к отправленному запросу присоединился дубликат
+    replayed.attach(replayed_waiter)
+    queue.put(waiting)
+    queue.requeue(replayed)
+
+    assert queue.qsize() == 1
+    queue.get().set_result(True)
+    for queued_request in (waiting, replayed, replayed_waiter):
+        assert queued_request.future.result(timeout=0) is True
+
+
+def test_coalesced_duplicate_raises_waiting_priority():
+    from fc.packet_type import RequestPriority
+
+    queue = LockedPriorityQueue()
+    queue.unlock()
+    polling = []
+    for request_id in range(3):
+        request = {"Id": request_id, "Type": "Scope", "Name": f"osc{request_id}"}
+        polling.append(QueuedRequest(request, "", priority=RequestPriority.POLLING))
+        queue.put(polling[-1])
+    urgent = QueuedRequest(
+        dict(polling[2].request, Id=3), "", priority=RequestPriority.CONTROL
+    )
+    queue.put(urgent)
+
+    assert queue.qsize() == 3
+    assert queue.get() is polling[2]
+    assert queue.stats()["size"] == {"POLLING": 2, "CONTROL": 0}
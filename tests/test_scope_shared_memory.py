@@ -0,0 +1,79 @@
+from communicator.scope_shared_memory import ScopeSharedMemory
+
+
+def test_frame_overwritten_while_copied_is_rejected():
+    producer = ScopeSharedMemory.create(slots=1, slot_size=4096)
+    consumer = ScopeSharedMemory.attach(producer.name, 1, 4096)
+    try:
+        descriptor = producer.write_frame({"Ia": [1.0, 2.0, 3.0]}, [0.0, 0.1, 0.2])
+        frame_view = consumer._frame_view
+
+        def overwrite_during_copy(slot, rows, samples):
+            # производитель успел записать в слот половину нового кадра
+            producer.slot_header.pack_into(producer.memory.buf, 0, 0, 0, 0)
+            view = frame_view(slot, rows, samples)
+            view[:] = 7.0
+            return view
+
+        consumer._frame_view = overwrite_during_copy
+        assert consumer.read_frame(descriptor) is None
+    finally:
+        consumer.close()
+        producer.close()
+        producer.unlink()
+
+
+def test_frame_read_is_a_copy():
+    producer = ScopeSharedMemory.create(slots=2, slot_size=4096)
+    try:
+        descriptor = producer.write_frame({"Ia": [1.0, 2.0]}, [0.0, 0.1])
+        data, time = producer.read_frame(descriptor)
+        producer.write_frame({"Ia": [5.0, 6.0]}, [0.2, 0.3])
+        producer.write_frame({"Ia": [8.0, 9.0]}, [0.4, 0.5])
+        assert data.tolist() == [[1.0, 2.0]] and time.tolist() == [0.0, 0.1]
+    finally:
+        producer.close()
+        producer.unlink()
+
+
+def test_pool_devices_get_separate_rings():
+    from PyQt5.QtCore import Qt
+
+    from communicator.bounded_queue import ResponseQueue
+    from fc.packet_type import OscMethods, RequestTypes
+    from fc.response_manager import ResponseManager
+
+    response_manager = ResponseManager(ResponseQueue())
+    frames = []
+    response_manager.oscill_frame_signal.connect(frames.append, Qt.DirectConnection)
+    producers = dict()
+    try:
+        for device, value in (("left", 1.0), ("right", 2.0)):
+            arguments = response_manager.enable_scope_shared_memory(
+                slots=2, slot_size=4096, device=device
+            )
+            producers[device] = ScopeSharedMemory.attach(
+                arguments["Name"], arguments["Slots"], arguments["SlotSize"]
+            )
+        descriptors = {
+            device: producers[device].write_frame({"Ia": [value]}, [0.0])
+            for device, value in (("left", 1.0), ("right", 2.0))
+        }
+        for device in ("left", "right"):
+            request = {
+                "Type": RequestTypes.SCOPE,
+                "Name": "osc",
+                "Method": OscMethods.REQUEST,
+                "Device": device,
+            }
+            response_manager._manage_answers(
+                request, {"SharedMemory": descriptors[device], "start": 0.0}
+            )
+        assert [(frame.name, frame.data[0, 0]) for frame in frames] == [
+            ("left/osc", 1.0),
+            ("right/osc", 2.0),
+        ]
+    finally:
+        for producer in producers.values():
+            producer.close()
+        response_manager.close()
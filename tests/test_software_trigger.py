@@ -0,0 +1,104 @@
+import numpy as np
+import pytest
+
+from fc.scope_frame import ScopeFrame
+from fc.software_trigger import FALLING, SoftwareTrigger, TriggerCondition
+
+SAMPLE_RATE = 10000.0
+
+
+def _signal(samples: int, frequency: float = 60.0, start: float = 0.0):
+    time = start + np.arange(samples) / SAMPLE_RATE
+    return time, np.sin(2 * np.pi * frequency * time)
+
+
+def _feed(trigger: SoftwareTrigger, time, values, chunk_samples: int) -> None:
+    data = np.vstack((values, np.zeros_like(values)))
+    for begin in range(0, time.size, chunk_samples):
+        end = begin + chunk_samples
+        trigger.feed(
+            ScopeFrame(data[:, begin:end], time[begin:end], ["Ia", "Ub"], time[begin])
+        )
+
+
+def _trigger(conditions, windows, **kwargs) -> SoftwareTrigger:
+    return SoftwareTrigger(conditions, 0.001, 0.002, windows.append, **kwargs)
+
+
+@pytest.mark.parametrize("chunk_samples", [1, 2, 7, 997, 10000, 50000])
+def test_edges_do_not_depend_on_chunk_size(chunk_samples):
+    time, values = _signal(50000)
+    windows = []
+    trigger = _trigger([TriggerCondition.edge("Ia", 0.0)], windows)
+    _feed(trigger, time, values, chunk_samples)
+
+    # 60 Гц за 5 с: 300 фронтов, первый - в самой первой точке потока,
+    # а до неё сигнал считается неизменным
+    assert trigger.triggers == 299
+    trigger_times = [window.trigger["Time"] for window in windows]
+    assert np.allclose(np.diff(trigger_times), 1 / 60.0, atol=1.5 / SAMPLE_RATE)
+    for window in windows:
+        index = window.trigger["Index"]
+        assert window.data[0, index - 1] < 0.0 <= window.data[0, index]
+        assert window.samples == 30
+
+
+def test_hysteresis_ignores_noise_around_level():
+    time, values = _signal(20000)
+    values = values + np.random.default_rng(1).normal(0.0, 0.02, values.size)
+    noisy, clean = [], []
+    without = _trigger([TriggerCondition.edge("Ia", 0.0)], noisy, holdoff=0.0)
+    with_hysteresis = _trigger(
+        [TriggerCondition.edge("Ia", 0.0, hysteresis=0.1)], clean, holdoff=0.0
+    )
+    _feed(without, time, values, 333)
+    _feed(with_hysteresis, time, values, 333)
+
+    assert without.triggers > 119
+    assert with_hysteresis.triggers == 119
+
+
+def test_falling_edge_qualified_by_level():
+    time, values = _signal(10000)
+    gate = (np.arange(values.size) >= 5000).astype(float)
+    data_time, windows = time, []
+    trigger = _trigger(
+        [
+            TriggerCondition.edge("Ia", 0.0, direction=FALLING),
+            TriggerCondition.level("Ub", 0.5),
+        ],
+        windows,
+    )
+    data = np.vstack((values, gate))
+    trigger.feed(ScopeFrame(data, data_time, ["Ia", "Ub"], 0.0))
+
+    assert trigger.triggers == 30
+    assert all(window.trigger["Time"] >= 0.5 for window in windows)
+
+
+def test_holdoff_skips_triggers_inside_it():
+    time, values = _signal(10000, frequency=100.0)
+    windows = []
+    trigger = _trigger([TriggerCondition.edge("Ia", 0.0)], windows, holdoff=0.025)
+    _feed(trigger, time, values, 1000)
+
+    # фронты каждые 10 мс, после срабатывания 25 мс пропускаются
+    assert trigger.triggers == 33
+    assert np.allclose(
+        np.diff([window.trigger["Time"] for window in windows]), 0.03, atol=1e-3
+    )
+
+
+def test_discontinuous_chunk_restarts_the_stream():
+    windows = []
+    trigger = _trigger([TriggerCondition.edge("Ia", 0.0)], windows)
+    time, values = _signal(10000)
+    _feed(trigger, time, values, 1000)
+    assert trigger.triggers == 59
+    # новая запись: время начинается заново, поток начинается сначала
+    restarted = len(windows)
+    _feed(trigger, time, values, 1000)
+
+    assert trigger.triggers == 118
+    assert len(windows) - restarted == 59
+    assert windows[restarted].trigger["Time"] == windows[0].trigger["Time"]
@@ -0,0 +1,109 @@
+"""
+Сериализация команд в JSON для отправки JsonRpcPipesConnector
+
+Используется orjson, если он установлен, иначе json из стандартной
+библиотеки. Выбор можно поменять через set_backend
+"""
+import json
+import math
+from typing import Any, Callable, Dict
+
+import numpy as np
+
+try:
+    import orjson
+
+    _orjson_options = orjson.OPT_SERIALIZE_NUMPY | orjson.OPT_NON_STR_KEYS
+except ImportError:
+    orjson = None
+
+_INFINITIES = (float("inf"), float("-inf"))
+
+
+def decorate_arguments(arguments_dict: dict) -> dict:
+    """
+    Замена бесконечностей в значениях словаря (и вложенных словарей) на строки
+    "inf" и "-inf", которые понимает JsonRpcPipesConnector
+    """
+    decorated_dict = dict()
+    for key, val in arguments_dict.items():
+        if isinstance(val, float) and val in _INFINITIES:
+            decorated_dict[key] = str(val)
+        elif isinstance(val, dict):
+            decorated_dict[key] = decorate_arguments(val)
+        else:
+            decorated_dict[key] = val
+    return decorated_dict
+
+
+def _decorated(value: Any) -> Any:
+    return decorate_arguments(value) if isinstance(value, dict) else value
+
+
+def _json_default(value: Any) -> Any:
+    # NumPy-массивы и скаляры, которые orjson пишет сам (OPT_SERIALIZE_NUMPY)
+    if hasattr(value, "tolist"):
+        return value.tolist()
+    raise TypeError(f"Object of type {type(value).__name__} is not JSON serializable")
+
+
+def _stdlib_dumps(value: Any, decorate: bool) -> str:
+    return json.dumps(_decorated(value) if decorate else value, default=_json_default)
+
+
+def _has_non_finite(value: Any) -> bool:
+    if isinstance(value, float):
+        return not math.isfinite(value)
+    if isinstance(value, dict):
+        return any(_has_non_finite(item) for item in value.values())
+    if isinstance(value, (list, tuple)):
+        return any(_has_non_finite(item) for item in value)
+    if getattr(value, "dtype", None) is not None and value.dtype.kind in "fc":
+        return not np.isfinite(value).all()
+    return False
+
+
+def _orjson_dumps(value: Any, decorate: bool) -> str:
+    # orjson пишет NaN и бесконечности как null. Обычно null в готовом JSON нет,
+    # а если есть, значение проверяется: это может быть и обычный None
+    encoded = orjson.dumps(value, option=_orjson_options)
+    if b"null" not in encoded or not _has_non_finite(value):
+        return encoded.decode()
+    if decorate:
+        value = _decorated(value)
+        if not _has_non_finite(value):
+            return orjson.dumps(value, option=_orjson_options).decode()
+    # остались NaN или бесконечности в списках: json пишет их как NaN и Infinity
+    return json.dumps(value, default=_json_default)
+
+
+_backends: Dict[str, Callable[[Any, bool], str]] = {"json": _stdlib_dumps}
+if orjson is not None:
+    _backends["orjson"] = _orjson_dumps
+
+
+class CommandEncoder:
+    def __init__(self):
+        self.backend = "orjson" if orjson is not None else "json"
+        self._dumps = _backends[self.backend]
+
+    @property
+    def available_backends(self):
+        return list(_backends)
+
+    def set_backend(self, name: str) -> None:
+        if name not in _backends:
+            raise ValueError(
+                f"JSON backend {name!r} is not available, use one of {list(_backends)}"
+            )
+        self.backend = name
+        self._dumps = _backends[name]
+
+    def encode(self, value: Any, decorate: bool = True) -> str:
+        """
+        :param decorate: заменить бесконечности строками (decorate_arguments)
+        """
+        return self._dumps(value, decorate)
+
+
+command_encoder = CommandEncoder()
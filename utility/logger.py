@@ -1,15 +1,41 @@
+import reprlib
 import sys
 from datetime import datetime
 from pathlib import Path
-from typing import Union
+from typing import Any, Union
 
 from loguru import logger
 
 rootLogger = logger
+# аргументы-функции вызываются, только если сообщение кто-то запишет:
+# lazyLogger.debug("{}", lambda: short_repr(payload))
+lazyLogger = logger.opt(lazy=True)
 now = datetime.now()
 dt_string = now.strftime("%d %B %Y")
 time_string = now.strftime("%H_%M_%S")
 
+# предел длины записи содержимого запросов и ответов в лог
+PAYLOAD_LOG_LIMIT = 1000
+
+_payload_repr = reprlib.Repr()
+_payload_repr.maxlevel = 4
+_payload_repr.maxdict = 16
+_payload_repr.maxlist = 8
+_payload_repr.maxarray = 8
+_payload_repr.maxstring = 200
+_payload_repr.maxother = 200
+
+
+def short_repr(value: Any, limit: int = PAYLOAD_LOG_LIMIT) -> str:
+    """
+    Сокращённое представление запроса или ответа для лога: длинные списки,
+    словари и строки обрезаются, а вся строка не длиннее limit символов
+    """
+    text = _payload_repr.repr(value)
+    if len(text) > limit:
+        text = f"{text[:limit]}... ({len(text)} chars)"
+    return text
+
 
 def init_logger_levels(
     root_logger_level: Union[int, str] = "DEBUG",
@@ -25,6 +51,8 @@ def init_logger_levels(
     :param file_handler_level: уровень логирования в файл
     :param console_handler_level: уровень логирования в консоль
 
+    Оба обработчика работают через очередь (enqueue): запись в консоль и файл
+    идёт в отдельном потоке, а не в потоках отправки и приёма
     """
     rootLogger.remove()
     rootLogger.add(
@@ -32,9 +60,11 @@ def init_logger_levels(
         level=root_logger_level
         if console_handler_level is None
         else console_handler_level,
+        enqueue=True,
     )
     rootLogger.add(
         Path("../logs") / dt_string / time_string / "log_{time}.log",
         level=root_logger_level if file_handler_level is None else file_handler_level,
         rotation="1 MB",
+        enqueue=True,
     )
@@ -0,0 +1,154 @@
+import math
+import threading
+from collections import defaultdict
+from typing import Callable, Dict, Hashable
+
+
+class LatencyHistogram:
+    """
+    Гистограмма задержек с логарифмически-линейными интервалами (как в HDR):
+    каждая октава делится на sub_buckets частей, поэтому относительная
+    погрешность перцентилей не больше 1 / sub_buckets при любом масштабе
+    """
+
+    sub_buckets = 16
+
+    def __init__(self):
+        self.count = 0
+        self.total = 0.0
+        self.max = 0.0
+        self._buckets: Dict[int, int] = defaultdict(int)
+
+    def record(self, seconds: float) -> None:
+        self.count += 1
+        self.total += seconds
+        if seconds > self.max:
+            self.max = seconds
+        if seconds > 0:
+            mantissa, exponent = math.frexp(seconds)
+            self._buckets[
+                exponent * self.sub_buckets + int((2 * mantissa - 1) * self.sub_buckets)
+            ] += 1
+        else:
+            self._buckets[-(1 << 30)] += 1
+
+    def percentile(self, fraction: float) -> float:
+        """
+        :return: верхняя граница интервала, в который попал перцентиль, в секундах
+        """
+        if not self.count:
+            return 0.0
+        rank = fraction * self.count
+        seen = 0
+        for index in sorted(self._buckets):
+            seen += self._buckets[index]
+            if seen >= rank:
+                return min(self.max, self._upper_bound(index))
+        return self.max
+
+    def _upper_bound(self, index: int) -> float:
+        if index == -(1 << 30):
+            return 0.0
+        exponent, sub_bucket = divmod(index, self.sub_buckets)
+        return math.ldexp(0.5 + (sub_bucket + 1) / (2 * self.sub_buckets), exponent)
+
+    def snapshot(self) -> dict:
+        return {
+            "count": self.count,
+            "mean": 1e3 * self.total / self.count if self.count else 0.0,
+            "p50": 1e3 * self.percentile(0.5),
+            "p90": 1e3 * self.percentile(0.9),
+            "p99": 1e3 * self.percentile(0.99),
+            "p99.9": 1e3 * self.percentile(0.999),
+            "max": 1e3 * self.max,
+        }
+
+
+def _key_name(key: Hashable) -> str:
+    if isinstance(key, tuple):
+        return "/".join(_key_name(part) for part in key)
+    return str(getattr(key, "value", key))
+
+
+class MetricsRegistry:
+    """
+    Счётчики, гистограммы задержек и показатели глубины очередей для пути
+    запроса от FC_Controls.make_request до ResponseManager
+
+    По умолчанию выключен. Места замеров проверяют enabled до любых вычислений,
+    поэтому в выключенном состоянии замер стоит одного чтения атрибута.
+    Показатели (gauges) - функции, которые вызываются только в snapshot
+    """
+
+    def __init__(self):
+        self.enabled = False
+        self._lock = threading.Lock()
+        self._counters: Dict[str, Dict[Hashable, int]] = defaultdict(
+            lambda: defaultdict(int)
+        )
+        self._histograms: Dict[str, Dict[Hashable, LatencyHistogram]] = defaultdict(
+            lambda: defaultdict(LatencyHistogram)
+        )
+        self._gauges: Dict[str, Callable[[], float]] = dict()
+
+    def enable(self) -> None:
+        self.enabled = True
+
+    def disable(self) -> None:
+        self.enabled = False
+
+    def increment(self, name: str, key: Hashable = None, value: int = 1) -> None:
+        with self._lock:
+            self._counters[name][key] += value
+
+    def observe(self, name: str, key: Hashable, seconds: float) -> None:
+        with self._lock:
+            self._histograms[name][key].record(seconds)
+
+    def register_gauge(self, name: str, gauge: Callable[[], float]) -> None:
+        self._gauges[name] = gauge
+
+    def unregister_gauge(self, name: str) -> None:
+        self._gauges.pop(name, None)
+
+    def reset(self) -> None:
+        with self._lock:
+            self._counters.clear()
+            self._histograms.clear()
+
+    def snapshot(self) -> dict:
+        """
+        :return: текущие значения; ключи (Type, Method) записаны как "Type/Method",
+            задержки - в миллисекундах
+        """
+        with self._lock:
+            counters = {
+                name: {_key_name(key): value for key, value in values.items()}
+                for name, values in self._counters.items()
+            }
+            latency_ms = {
+                name: {
+                    _key_name(key): histogram.snapshot()
+                    for key, histogram in histograms.items()
+                }
+                for name, histograms in self._histograms.items()
+            }
+        gauges = dict()
+        for name, gauge in list(self._gauges.items()):
+            try:
+                gauges[name] = gauge()
+            except Exception:
+                gauges[name] = None
+        return {
+            "enabled": self.enabled,
+            "counters": counters,
+            "latency_ms": latency_ms,
+            "gauges": gauges,
+        }
+
+
+def request_key(request: dict) -> tuple:
+    return request.get("Type"), request.get("Method")
+
+
+metrics = MetricsRegistry()